@@ -0,0 +1,89 @@
+"""
+Helpers shared by all the run scripts to find, load and process the regions in the Data folder.
+
+All the codes presented below were developed by:
+    Dr. Gerardo Tinoco Guerrero
+    Universidad Michoacana de San Nicolás de Hidalgo
+    gerardo.tinoco@umich.mx
+
+With the funding of:
+    National Council of Humanities, Sciences and Technologies, CONAHCyT (Consejo Nacional de Humanidades, Ciencias y Tecnologías, CONAHCyT). México.
+    Coordination of Scientific Research, CIC-UMSNH (Coordinación de la Investigación Científica de la Universidad Michoacana de San Nicolás de Hidalgo, CIC-UMSNH). México
+    Aula CIMNE-Morelia. México
+
+Date:
+    May, 2024.
+
+Last Modification:
+    May, 2024.
+"""
+## Library importation.
+import os
+import numpy as np
+import matplotlib
+from numba import set_num_threads
+
+## Suffixes of the data files of each region.
+suffixes = ('_p.csv', '_tt.csv')                                                    # Look for the files ending in "_p.csv" and "_tt.csv"
+
+## List the data files in a folder.
+def list_files(path):
+    return [entry.name for entry in os.scandir(path) if entry.is_file()]            # Names of the files, without the subfolders.
+
+## Create a dictionary to get all the regions in da Data folder.
+def group_files_by_region(files):
+    regions = {}                                                                    # Dictionary for the regions.
+    for file in files:                                                              # For each of the files in clouds.
+        for suffix in suffixes:                                                     # For each of the suffixes.
+            if file.endswith(suffix):                                               # If the file ends with the suffix.
+                region = file[:-len(suffix)]                                        # Get the name of the region.
+                regions.setdefault(region, {})[suffix] = file                       # Add the file to the regions.
+                break                                                               # A file has only one suffix.
+    return regions                                                                  # Return the regions dictionary.
+
+## Load a data file, keeping a binary copy to skip the parsing in later runs.
+def load_data(path, dtype = np.float64):
+    cache = path + '.npy'                                                           # Binary copy of the data file.
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(path):
+                                                                                    # If the file was already parsed and has not changed since.
+        try:
+            data = np.load(cache, mmap_mode = 'c')                                  # Map the binary copy, copied only where it is written.
+        except (ValueError, OSError, EOFError):                                     # If the binary copy can not be read.
+            data = None                                                             # The data file is parsed again.
+        if data is not None and data.dtype == dtype:                                # If it was saved with the requested type.
+            return data                                                             # Return the mapped data.
+    data = np.loadtxt(path, delimiter = ',', ndmin = 2).astype(dtype)               # Parse the data file.
+    temp = f'{path}.{os.getpid()}.npy'                                              # Temporary file, one for each process.
+    np.save(temp, data)                                                             # Save the binary copy in the temporary file.
+    os.replace(temp, cache)                                                         # Move it over the old copy, so it is never read half written.
+    return data                                                                     # Return the data.
+
+## Key of a theoretical solution, with everything it was computed from.
+def exact_key(coef, t, dtype, p_path):
+    return repr((list(coef), t, np.dtype(dtype).name, os.path.getmtime(p_path)))
+                                                                                    # Coefficients, time steps, type and date of the points.
+
+## Load a saved theoretical solution, only if it was computed with the same key.
+def load_exact(path, key):
+    key_path = os.path.splitext(path)[0] + '.key'                                   # File with the key of the saved solution.
+    if not (os.path.exists(path) and os.path.exists(key_path)):                     # If there is no saved solution.
+        return None                                                                 # It must be computed.
+    with open(key_path) as file:                                                    # Open the key of the saved solution.
+        if file.read() != key:                                                      # If it was computed for another problem.
+            return None                                                             # It must be computed again.
+    return np.load(path, mmap_mode = 'c')                                           # Map the saved theoretical solution.
+
+## Save a theoretical solution together with its key.
+def save_exact(path, key, u_ex):
+    key_path = os.path.splitext(path)[0] + '.key'                                   # File with the key of the saved solution.
+    if os.path.exists(key_path):                                                    # If there is an older key.
+        os.remove(key_path)                                                         # Remove it, so a failed write is never reused.
+    np.save(path, u_ex)                                                             # Save the theoretical solution.
+    with open(key_path, 'w') as file:                                               # Create the file for the key.
+        file.write(key)                                                             # Save the key, only after the solution.
+
+## Prepare each of the worker processes.
+def init_worker(save):
+    set_num_threads(1)                                                              # One compiled thread per worker.
+    if save:                                                                        # If the figures are only saved.
+        matplotlib.use('Agg')                                                       # Non-interactive backend, no display needed.
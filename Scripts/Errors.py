@@ -17,7 +17,26 @@ Last Modification:
 """
 ## Library importation.
 import numpy as np
+from dataclasses import dataclass
+from numba import njit
+import Scripts.Neighbors as Neighbors
 
+@dataclass
+class CloudData:
+    """
+    CloudData
+    Per-node data of a cloud of points that only depends on the geometry, computed once by precompute_cloud.
+    
+    Attributes:
+        indptr      m + 1           Array           Position of the first neighbor of each node in indices.
+        indices     nnz             Array           Neighbors of all the nodes, stored consecutively.
+        areas       m               Array           Area of the polygon defined by the neighbors of each node.
+    """
+    indptr:  np.ndarray
+    indices: np.ndarray
+    areas:   np.ndarray
+
+@njit(cache = True)
 def PolyArea(x,y):
     """
     PolyArea
@@ -31,10 +50,59 @@ def PolyArea(x,y):
         area                        Float           Area of the polygon.
     """
     ## Area computation.
-    area = 0.5*np.abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))          # Compute the area of the element.
+    area = 0.0                                                                      # Accumulator for the shoelace formula.
+    j    = len(x) - 1                                                               # The previous vertex of the first one is the last one.
+    for i in range(len(x)):                                                         # For each of the vertices.
+        area += (x[j] - x[i])*(y[i] + y[j])                                         # Add the contribution of the edge (j, i).
+        j     = i                                                                   # The current vertex is the previous one for the next edge.
+    area = 0.5*abs(area)                                                            # Compute the area of the element.
+    return area
+
+def Cloud_Areas(p, vec):
+    """
+    Cloud_Areas
+    Function to calculate, for all the nodes at once, the area of the polygon defined by the neighbors of each node.
+    The rows of vec are padded with the first neighbor of the node, so the padded vertices close the polygon without adding area.
+    
+    Input:
+        p           m x 2           Array           Array with the coordinates of the nodes.
+        vec         m x nvec        Array           Array with the correspondence of the nvec neighbors of each node.
+    
+    Output:
+        area        m               Array           Area of the polygon of each node.
+    """
+
+    ## Variable initialization.
+    vec   = np.ascontiguousarray(vec, dtype = np.int32)                             # Neighbors as integer indices.
+    valid = vec != -1                                                               # Mask with the existing neighbors.
+    index = np.where(valid, vec, vec[:, :1])                                        # Missing neighbors are replaced by the first one.
+    PX    = p[index, 0]                                                             # The x-values of all the polygons.
+    PY    = p[index, 1]                                                             # The y-values of all the polygons.
+
+    ## Area computation.
+    area  = 0.5*np.abs(np.sum(PX*np.roll(PY, 1, axis = 1) - PY*np.roll(PX, 1, axis = 1), axis = 1))
+                                                                                    # Shoelace formula for all the polygons.
     return area
 
-def Cloud_Transient(p, vec, u_ap, u_ex):
+def precompute_cloud(p, vec):
+    """
+    precompute_cloud
+    Function to compute, only once, the neighbors in CSR layout and the polygon areas of a cloud of points.
+    The result can be passed to the error routines and to Gammas.Cloud to skip all the per-node work.
+    
+    Input:
+        p           m x 2           Array           Array with the coordinates of the nodes.
+        vec         m x nvec        Array           Array with the correspondence of the nvec neighbors of each node.
+    
+    Output:
+        cloud                       CloudData       Neighbors in CSR layout and areas of the nodes.
+    """
+    vec             = np.ascontiguousarray(vec, dtype = np.int32)                   # Neighbors as integer indices, cast only once.
+    indptr, indices = Neighbors.build_neighbor_csr(vec)                             # The neighbors in CSR layout.
+    areas           = Cloud_Areas(p, vec)                                           # Area of the polygon of each node.
+    return CloudData(indptr, indices, areas)
+
+def Cloud_Transient(p, vec, u_ap, u_ex, cloud = None):
     """
     Cloud_Transient
     Function to compute the error in a triangulation or an unstructured cloud of points for a problem that depends on time.
@@ -45,34 +113,29 @@ def Cloud_Transient(p, vec, u_ap, u_ex):
         vec         m x nvec        Array           Array with the correspondence of the nvec neighbors of each node.
         u_ap        m x t           Array           Array with the computed solution.
         u_ex        m x t           Array           Array with the theoretical solution.
+        cloud                       CloudData       Precomputed data of the cloud (Default: None, the areas are computed).
     
     Output:
         er          t x 1           Array           Mean square error computed on each time step.
     """
 
     ## Variable initialization.
-    m, t = p.shape[0], u_ap.shape[1]                                                # The size of the region.
-    er   = np.zeros(t)                                                              # er initialization with zeros.
-    area = np.zeros(m)                                                              # area initialization with zeros.
-
-    ## Area computation for each node.
-    for i in np.arange(m):
-        nvec     = sum(vec[i,:] != -1)                                              # The number of neighbors of the central node.
-        polix    = np.zeros([nvec])                                                 # The x-values of the polygon are stored.
-        poliy    = np.zeros([nvec])                                                 # The y-values of the polygon are stored.
-        nindex   = vec[i, :nvec].astype(int)                                        # Indices of the neighbors.
-        polix[:] = p[nindex, 0]                                                     # The x coordinate of the node is stored.
-        poliy[:] = p[nindex, 1]                                                     # The y coordinate of the node is stored.
-        area[i]  = PolyArea(polix, poliy)                                           # Area computation.
+    m    = p.shape[0]                                                               # The size of the region.
+
+    ## Area computation for all the nodes at once.
+    if cloud is None:                                                               # If the data of the cloud was not precomputed.
+        vec  = np.ascontiguousarray(vec, dtype = np.int32)                          # Neighbors as integer indices, cast only once.
+        area = Cloud_Areas(p, vec)                                                  # Area of the polygon of each node.
+    else:                                                                           # If the data of the cloud is available.
+        area = cloud.areas                                                          # The precomputed areas are used.
 
     ## Error computation.
-    for k in np.arange(t):                                                          # For each time step.
-        err   = np.square(u_ap[:, k] - u_ex[:, k])*area                             # Mean square error computation.
-        er[k] = np.sqrt(np.mean(err))                                               # The square root is computed.
+    diff = u_ap - u_ex                                                              # Difference between both solutions on all the time steps.
+    er   = np.sqrt(np.einsum('ij,ij,i->j', diff, diff, area)/m)                     # Mean square error of each time step.
     
     return er
 
-def Cloud_Stationary(p, vec, u_ap, u_ex):
+def Cloud_Stationary(p, vec, u_ap, u_ex, cloud = None):
     """
     Cloud_Stationary
     Function to compute the error in a triangulation or an unstructured cloud of points for a problem that depends on time.
@@ -83,6 +146,7 @@ def Cloud_Stationary(p, vec, u_ap, u_ex):
         vec         m x nvec        Array           Array with the correspondence of the nvec neighbors of each node.
         u_ap        m x t           Array           Array with the computed solution.
         u_ex        m x t           Array           Array with the theoretical solution.
+        cloud                       CloudData       Precomputed data of the cloud (Default: None, the areas are computed).
     
     Output:
         er          t x 1           Array           Mean square error computed on each time step.
@@ -91,20 +155,16 @@ def Cloud_Stationary(p, vec, u_ap, u_ex):
     ## Variable initialization.
     m    = p.shape[0]                                                               # The size of the region.
     er   = 0                                                                        # er initialization with zeros.
-    area = np.zeros(m)                                                              # area initialization with zeros.
-
-    ## Area computation for each node.
-    for i in np.arange(m):
-        nvec     = sum(vec[i,:] != -1)                                              # The number of neighbors of the central node.
-        polix    = np.zeros([nvec])                                                 # The x-values of the polygon are stored.
-        poliy    = np.zeros([nvec])                                                 # The y-values of the polygon are stored.
-        nindex   = vec[i, :nvec].astype(int)                                        # Indices of the neighbors.
-        polix[:] = p[nindex, 0]                                                     # The x coordinate of the node is stored.
-        poliy[:] = p[nindex, 1]                                                     # The y coordinate of the node is stored.
-        area[i]  = PolyArea(polix, poliy)                                           # Area computation.
+
+    ## Area computation for all the nodes at once.
+    if cloud is None:                                                               # If the data of the cloud was not precomputed.
+        vec  = np.ascontiguousarray(vec, dtype = np.int32)                          # Neighbors as integer indices, cast only once.
+        area = Cloud_Areas(p, vec)                                                  # Area of the polygon of each node.
+    else:                                                                           # If the data of the cloud is available.
+        area = cloud.areas                                                          # The precomputed areas are used.
 
     ## Error computation.
-    err = np.square(u_ap[:] - u_ex[:])*area                                         # Mean square error computation.
-    er  = np.sqrt(np.mean(err))                                                     # The square root is computed.
+    diff = u_ap - u_ex                                                              # Difference between both solutions.
+    er   = np.sqrt(np.einsum('i,i,i->', diff, diff, area)/m)                        # Mean square error computation.
     
     return er
\ No newline at end of file
@@ -17,8 +17,30 @@ Last Modification:
 """
 
 import numpy as np
+from dataclasses import dataclass
+from numba import njit, prange
+from scipy.sparse import csr_matrix
+import Scripts.Neighbors as Neighbors
 
-def Cloud(p, vec, L):
+@dataclass
+class GammaData:
+    """
+    GammaData
+    Gammas of a cloud of points for each of the unit differential operators, computed once by Basis.
+    Since the Gammas are linear in L, the K matrix of any operator is a combination of these ones (see Assemble).
+    
+    Attributes:
+        indptr      m + 1           Array           Position of the first entry of each row of K.
+        indices     nnz             Array           Column of each entry of K.
+        data        5 x nnz         Array           Value of each entry of K for the unit operators D, E, A, B and C.
+        boun        b               Array           Position of the entries of the boundary nodes.
+    """
+    indptr:  np.ndarray
+    indices: np.ndarray
+    data:    np.ndarray
+    boun:    np.ndarray
+
+def Cloud(p, vec, L, cloud = None):
     """
     2D Clouds of Points Gammas Computation.
      
@@ -28,44 +50,172 @@ def Cloud(p, vec, L):
         p           m x 3           Array           Array with the coordinates of the nodes and a flag for the boundary.
         vec         m x nvec        Array           Array with the correspondence of the 'nvec' neighbors of each node.
         L           5 x 1           Array           Array with the values of the differential operator.
+        cloud                       CloudData       Precomputed neighbors in CSR layout (Default: None, computed from vec).
+     
+     Output:
+        K           m x m           csr_matrix      Sparse K Matrix with the computed Gammas.
+    """
+    # Gammas computation and Matrix assembly
+    m     = len(p[:,0])                                                             # The total number of nodes.
+    L     = np.asarray(L, dtype = np.float64).reshape(5, 1)                         # The differential operator as a column.
+    Kptr, cols, data = Gammas_CSR(p, vec, L, cloud)                                 # Gammas in CSR layout.
+    K = csr_matrix((data[0], cols, Kptr), shape = (m, m))                           # K is assembled directly in CSR format.
+    return K
+
+def Basis(p, vec, cloud = None):
+    """
+    2D Clouds of Points Gammas Computation for the unit operators.
+     
+    This function computes the Gamma values for each of the unit differential operators, so they can be reused for any operator.
+     
+    Input:
+        p           m x 3           Array           Array with the coordinates of the nodes and a flag for the boundary.
+        vec         m x nvec        Array           Array with the correspondence of the 'nvec' neighbors of each node.
+        cloud                       CloudData       Precomputed neighbors in CSR layout (Default: None, computed from vec).
+     
+     Output:
+        Gamma                       GammaData       Gammas for the unit operators.
+    """
+    Kptr, cols, data = Gammas_CSR(p, vec, np.identity(5), cloud)                    # Gammas for the five unit operators at once.
+    boun = Kptr[:-1][p[:,2] != 0]                                                   # The boundary rows only have the central node.
+    return GammaData(Kptr, cols, data, boun)
+
+def Assemble(Gamma, L):
+    """
+    K matrix assembly from the Gammas for the unit operators.
+     
+    Input:
+        Gamma                       GammaData       Gammas for the unit operators.
+        L           5 x 1           Array           Array with the values of the differential operator.
+     
+     Output:
+        K           m x m           csr_matrix      Sparse K Matrix with the computed Gammas.
+    """
+    m    = len(Gamma.indptr) - 1                                                    # The total number of nodes.
+    data = np.asarray(L, dtype = np.float64).ravel()@Gamma.data                     # Gammas for the requested operator.
+    data[Gamma.boun] = 1                                                            # Central node weight is equal to 1 on the boundary.
+    K = csr_matrix((data, Gamma.indices, Gamma.indptr), shape = (m, m))             # K is assembled directly in CSR format.
+    return K
+
+def Gammas_CSR(p, vec, L, cloud = None):
+    """
+    Gammas computation in CSR layout for one or several differential operators.
+     
+    Input:
+        p           m x 3           Array           Array with the coordinates of the nodes and a flag for the boundary.
+        vec         m x nvec        Array           Array with the correspondence of the 'nvec' neighbors of each node.
+        L           5 x q           Array           Array with the values of the q differential operators.
+        cloud                       CloudData       Precomputed neighbors in CSR layout (Default: None, computed from vec).
      
      Output:
-        K           m x m           Array           K Matrix with the computed Gammas.
+        Kptr        m + 1           Array           Position of the first entry of each row of K.
+        cols        nnz             Array           Column of each entry of K.
+        data        q x nnz         Array           Value of each entry of K for each of the operators.
     """
     # Variable initialization
-    nvec  = len(vec[0,:])                                                           # The maximum number of neighbors.
     m     = len(p[:,0])                                                             # The total number of nodes.
-    K     = np.zeros([m,m])                                                         # K initialization with zeros.
+    L     = np.ascontiguousarray(L, dtype = np.float64)                             # The differential operators as columns.
+    if cloud is None:                                                               # If the neighbors were not precomputed.
+        indptr, indices = Neighbors.build_neighbor_csr(vec)                         # The neighbors in CSR layout.
+    else:                                                                           # If the neighbors are available.
+        indptr, indices = cloud.indptr, cloud.indices                               # The precomputed neighbors are used.
+
+    # CSR structure of K
+    count = np.where(p[:,2] != 0, 1, np.diff(indptr) + 1)                           # Entries of each row: the central node and its neighbors.
+    Kptr  = np.zeros(m + 1, dtype = np.int32)                                       # Kptr initialization with zeros.
+    Kptr[1:] = np.cumsum(count)                                                     # Position of the first entry of each row of K.
+    cols  = np.empty(Kptr[-1], dtype = np.int32)                                    # Column of each entry of K.
+    data  = np.empty((L.shape[1], Kptr[-1]))                                        # Value of each entry of K for each operator.
     
-    # Gammas computation and Matrix assembly
-    for i in np.arange(m):                                                          # For each of the nodes.
-        if p[i,2] == 0:                                                             # If the node is an inner node.
-            nvec = sum(vec[i,:] != -1)                                              # The total number of neighbors of the node.
-            dx   = np.zeros([nvec])                                                 # dx initialization with zeros.
-            dy   = np.zeros([nvec])                                                 # dy initialization with zeros.
-            for j in np.arange(nvec):                                               # For each of the neighbor nodes.
-                vec1  = int(vec[i, j])                                              # The neighbor index is found.
-                dx[j] = p[vec1, 0] - p[i,0]                                         # dx is computed.
-                dy[j] = p[vec1, 1] - p[i,1]                                         # dy is computed.
-            M     = np.vstack([[dx], [dy], [dx**2], [dx*dy], [dy**2]])              # M matrix is assembled.
-            M     = np.linalg.pinv(M)                                               # The pseudoinverse of matrix M.
-            YY    = M@L                                                             # M*L computation.
-            Gamma = np.vstack([-sum(YY), YY]).transpose()                           # Gamma values are found.
-            K[i,i] = Gamma[0,0]                                                     # The corresponding Gamma for the central node.
-            for j in np.arange(nvec):                                               # For each of the neighbor nodes.
-                K[i, vec[i,j]] = Gamma[0,j+1]                                       # The corresponding Gamma for the neighbor node.
-            
-        if p[i,2] == 1 or p[i,2] == 2:                                              # If the node is in the boundary.
-            K[i,i] = 1                                                              # Central node weight is equal to 1.
-            for j in np.arange(nvec):                                               # For each of the neighbor nodes.
-                K[i, vec[i,j]] = 0                                                  # Neighbor node weight is equal to 0.
-    return K
+    # Gammas computation
+    gammas_kernel(np.ascontiguousarray(p, dtype = np.float64), indptr, indices, L, Kptr, cols, data)
+    return Kptr, cols, data
+
+@njit(parallel = True, cache = True)
+def gammas_kernel(p, indptr, indices, L, Kptr, cols, data):
+    """
+    Compiled kernel for the Gammas computation; node i only writes the entries Kptr[i], ..., Kptr[i + 1] - 1 of K.
+    All the temporaries are local to each iteration, so the nodes are processed in parallel without races.
+    The Gammas are the minimum norm solution of M*Gamma = L, found through the 5 x 5 system (M*M^T)*z = L.
+    Each column of L is a differential operator, and row q of data holds its Gammas; M*M^T is factored once for all of them.
+    """
+    m = p.shape[0]                                                                  # The total number of nodes.
+    q = L.shape[1]                                                                  # The total number of operators.
+    for i in prange(m):                                                             # For each of the nodes.
+        r       = Kptr[i]                                                           # First entry of the row of the node.
+        cols[r] = i                                                                 # The central node goes first.
+        if p[i,2] != 0:                                                             # If the node is in the boundary.
+            data[:, r] = 1                                                          # Central node weight is equal to 1.
+        else:                                                                       # If the node is an inner node.
+            nidx = indices[indptr[i]:indptr[i+1]]                                   # The neighbors of the node.
+            nvec = len(nidx)                                                        # The total number of neighbors of the node.
+            dx   = p[nidx, 0] - p[i,0]                                              # dx is computed for all the neighbors.
+            dy   = p[nidx, 1] - p[i,1]                                              # dy is computed for all the neighbors.
+            M    = np.vstack((dx, dy, dx**2, dx*dy, dy**2))                         # M matrix is assembled.
+            A    = np.empty((5, 5))                                                 # Lower triangle of M*M^T.
+            for a in range(5):                                                      # For each of the rows of M.
+                for b in range(a + 1):                                              # For each of the rows of M up to a.
+                    s = 0.0                                                         # Accumulator for the dot product.
+                    for j in range(nvec):                                           # For each of the neighbor nodes.
+                        s += M[a, j]*M[b, j]                                        # Contribution of the neighbor.
+                    A[a, b] = s                                                     # Entry of M*M^T.
+            z = L.copy()                                                            # The right-hand sides, overwritten with the solution.
+            if nvec >= 5 and cholesky_solve(A, z):                                  # If the system has full rank.
+                YY = np.zeros((nvec, q))                                            # YY initialization with zeros.
+                for j in range(nvec):                                               # For each of the neighbor nodes.
+                    for l in range(q):                                              # For each of the operators.
+                        for a in range(5):                                          # For each of the rows of M.
+                            YY[j, l] += M[a, j]*z[a, l]                             # Minimum norm solution, YY = M^T*z.
+            else:                                                                   # If the system is rank-deficient.
+                YY = np.linalg.pinv(M)@L                                            # The pseudoinverse of matrix M is used.
+            for l in range(q):                                                      # For each of the operators.
+                data[l, r] = -np.sum(YY[:, l])                                      # The corresponding Gamma for the central node.
+            for j in range(nvec):                                                   # For each of the neighbor nodes.
+                cols[r + j + 1] = nidx[j]                                           # The column of the neighbor node.
+                data[:, r + j + 1] = YY[j, :]                                       # The corresponding Gamma for the neighbor node.
+
+@njit(cache = True)
+def cholesky_solve(A, z):
+    """
+    Helper function to solve the small symmetric positive definite system A*x = z in place through a Cholesky factorization.
+    Only the lower triangle of A is used, and it is overwritten with the factor; z is overwritten with the solution.
+    Returns False, leaving z unfinished, if A is not positive definite.
+    """
+    n = A.shape[0]                                                                  # The size of the system.
+    for a in range(n):                                                              # For each of the columns.
+        d = A[a, a]                                                                 # Diagonal entry of the column.
+        for k in range(a):                                                          # For each of the previous columns.
+            d -= A[a, k]*A[a, k]                                                    # Remove the contribution of the column.
+        if d <= 0.0:                                                                # If the matrix is not positive definite.
+            return False
+        d       = np.sqrt(d)                                                        # Diagonal entry of the factor.
+        A[a, a] = d
+        for b in range(a + 1, n):                                                   # For each of the entries below the diagonal.
+            s = A[b, a]                                                             # Entry of the matrix.
+            for k in range(a):                                                      # For each of the previous columns.
+                s -= A[b, k]*A[a, k]                                                # Remove the contribution of the column.
+            A[b, a] = s/d                                                           # Entry of the factor.
+    for l in range(z.shape[1]):                                                     # For each of the right-hand sides.
+        for a in range(n):                                                          # Forward substitution with the factor.
+            s = z[a, l]
+            for k in range(a):
+                s -= A[a, k]*z[k, l]
+            z[a, l] = s/A[a, a]
+        for a in range(n - 1, -1, -1):                                              # Backward substitution with its transpose.
+            s = z[a, l]
+            for k in range(a + 1, n):
+                s -= A[k, a]*z[k, l]
+            z[a, l] = s/A[a, a]
+    return True
 
-def RHS(p, boun_n, inne_n, phi, f):
+def RHS(p, boun_n, inne_n, phi, f, phi_n = None):
     m     = len(p[:,0])                                                             # The total number of nodes.
     R     = np.zeros([m])                                                           # K initialization with zeros.
 
     R[inne_n] = f(p[inne_n, 0], p[inne_n, 1])
-    R[boun_n] = phi(p[boun_n, 0], p[boun_n, 1])
+    if phi_n is None:                                                               # If phi was not evaluated on the nodes.
+        R[boun_n] = phi(p[boun_n, 0], p[boun_n, 1])
+    else:                                                                           # If the values of phi are available.
+        R[boun_n] = phi_n[boun_n]                                                   # The values of phi are reused.
 
     return R
\ No newline at end of file
@@ -21,6 +21,30 @@ import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib import cm
 from matplotlib.animation import FuncAnimation
+from matplotlib.tri import Triangulation
+
+def update_surface(surf, triang, z):
+    """
+    update_surface
+
+    This function updates the heights and colors of a surface created with plot_trisurf, without creating it again.
+
+    Input:
+        surf                        Poly3DCollection    Surface to be updated.
+        triang                      Triangulation       Triangulation of the nodes.
+        z           m x 1           ndarray             Array with the new heights of the nodes.
+        
+    Output:
+        None
+    """
+    tri   = triang.triangles                                                        # The correspondence of the triangles.
+    verts = np.empty(tri.shape + (3,), dtype = np.float32)                          # Vertices of all the triangles, in single precision.
+    verts[:, :, 0] = triang.x[tri]                                                  # x coordinates of the vertices.
+    verts[:, :, 1] = triang.y[tri]                                                  # y coordinates of the vertices.
+    verts[:, :, 2] = z[tri]                                                         # Heights of the vertices.
+    surf.set_verts(verts)                                                           # The triangles are updated.
+    surf.set_array(verts[:, :, 2].mean(axis = 1))                                   # The colors follow the mean height of each triangle.
+    surf.autoscale()                                                                # The colormap is scaled to the new heights.
 
 def Cloud_Stationary(p, tt, u_ap, u_ex, save = False, nom = ''):
     """
@@ -46,17 +70,18 @@ def Cloud_Stationary(p, tt, u_ap, u_ex, save = False, nom = ''):
     # Variable initialization.
     min_val = u_ex.min()
     max_val = u_ex.max()
+    triang  = Triangulation(p[:, 0], p[:, 1], tt)
 
     fig, (ax1, ax2) = plt.subplots(1, 2, subplot_kw={"projection": "3d"}, figsize=(10, 5))
     
     # Plotting the approximated solution
-    ax1.plot_trisurf(p[:, 0], p[:, 1], u_ap[:], triangles=tt, cmap=cm.coolwarm, linewidth=0, antialiased=False)
+    ax1.plot_trisurf(triang, u_ap[:], cmap=cm.coolwarm, linewidth=0, antialiased=False)
     ax1.set_zlim([min_val, max_val])
     ax1.view_init(elev = 9, azim = -50)
     ax1.set_title('Approximation')
     
     # Plotting the theoretical solution
-    ax2.plot_trisurf(p[:, 0], p[:, 1], u_ex[:], triangles=tt, cmap=cm.coolwarm, linewidth=0, antialiased=False)
+    ax2.plot_trisurf(triang, u_ex[:], cmap=cm.coolwarm, linewidth=0, antialiased=False)
     ax2.set_zlim([min_val, max_val])
     ax2.view_init(elev = 9, azim = -50)
     ax2.set_title('Theoretical Solution')
@@ -139,58 +164,49 @@ def Cloud_Transient(p, tt, u_ap, u_ex, save = False, nom = ''):
     T       = np.linspace(0, 1, t)
     min_val = u_ex.min()
     max_val = u_ex.max()
+    triang  = Triangulation(p[:, 0], p[:, 1], tt)
 
     fig, (ax1, ax2) = plt.subplots(1, 2, subplot_kw = {"projection": "3d"}, figsize = (10, 5))
+
+    ## The surfaces are created only once; each frame only updates their heights.
+    surf1 = ax1.plot_trisurf(triang, u_ap[:, 0], cmap = cm.coolwarm, linewidth = 0, antialiased = False)
+    ax1.set_zlim([min_val, max_val])
+    ax1.set_title('Approximation')
+
+    surf2 = ax2.plot_trisurf(triang, u_ex[:, 0], cmap = cm.coolwarm, linewidth = 0, antialiased = False)
+    ax2.set_zlim([min_val, max_val])
+    ax2.set_title('Theoretical Solution')
     
     if save:
         def update_plot(k):
-            k = min(k, t - 1)
-            ax1.clear()
-            ax2.clear()
             tin = float(T[k])
             fig.suptitle('Solution at t = %1.3f s.' % tin)
             
-            ax1.plot_trisurf(p[:, 0], p[:, 1], u_ap[:, k], triangles = tt, cmap = cm.coolwarm, linewidth = 0, antialiased = False)
-            ax1.set_zlim([min_val, max_val])
-            ax1.set_title('Approximation')
-            
-            ax2.plot_trisurf(p[:, 0], p[:, 1], u_ex[:, k], triangles = tt, cmap = cm.coolwarm, linewidth = 0, antialiased = False)
-            ax2.set_zlim([min_val, max_val])
-            ax2.set_title('Theoretical Solution')
+            update_surface(surf1, triang, u_ap[:, k])
+            update_surface(surf2, triang, u_ex[:, k])
             
             return fig, 
     
-        ani = FuncAnimation(fig, update_plot, frames = np.arange(0, t+1, step), blit = True)
+        frames = np.unique(np.append(np.arange(0, t, step), t - 1))                # The time levels to draw, always including the last one.
+        ani = FuncAnimation(fig, update_plot, frames = frames, blit = False, cache_frame_data = False)
         ani.save(nom, writer = 'ffmpeg', fps = 10)
-        plt.close()
+        plt.close(fig)
 
     else:
-        for k in np.arange(0, t, step):
+        for k in range(0, t, step):
             tin = float(T[k])
             fig.suptitle('Solution at t = %1.3f s.' %tin)
 
-            ax1.plot_trisurf(p[:, 0], p[:, 1], u_ap[:, k], triangles = tt, cmap = cm.coolwarm, linewidth = 0, antialiased = False)
-            ax1.set_zlim([min_val, max_val])
-            ax1.set_title('Approximation')
-            
-            ax2.plot_trisurf(p[:, 0], p[:, 1], u_ex[:, k], triangles = tt, cmap = cm.coolwarm, linewidth = 0, antialiased = False)
-            ax2.set_zlim([min_val, max_val])
-            ax2.set_title('Theoretical Solution')
+            update_surface(surf1, triang, u_ap[:, k])
+            update_surface(surf2, triang, u_ex[:, k])
 
             plt.pause(0.01)
-            ax1.clear()
-            ax2.clear()
 
         tin = float(T[-1])
         fig.suptitle('Solution at t = %1.3f s.' %tin)
 
-        ax1.plot_trisurf(p[:, 0], p[:, 1], u_ap[:, -1], triangles = tt, cmap = cm.coolwarm, linewidth = 0, antialiased = False)
-        ax1.set_zlim([min_val, max_val])
-        ax1.set_title('Approximation')
-        
-        ax2.plot_trisurf(p[:, 0], p[:, 1], u_ex[:, -1], triangles = tt, cmap = cm.coolwarm, linewidth = 0, antialiased = False)
-        ax2.set_zlim([min_val, max_val])
-        ax2.set_title('Theoretical Solution')
+        update_surface(surf1, triang, u_ap[:, -1])
+        update_surface(surf2, triang, u_ex[:, -1])
 
         plt.pause(0.1)
         plt.close()
@@ -220,24 +236,31 @@ def Cloud_Transient_Steps(p, tt, u_ap, u_ex, nom):
     min_val = u_ex.min()
     max_val = u_ex.max()
     T       = np.linspace(0, 1, t)
+    triang  = Triangulation(p[:, 0], p[:, 1], tt)
+
+    ## Create the figure only once.
+    fig, (ax1, ax2) = plt.subplots(1, 2, subplot_kw = {"projection": "3d"}, figsize = (10, 5))
+    surf1 = ax1.plot_trisurf(triang, u_ap[:, 0], cmap = cm.coolwarm, linewidth = 0, antialiased = False)
+    surf1.set_rasterized(True)                                                     # The surface is embedded as an image in the EPS file.
+    ax1.set_zlim([min_val, max_val])
+    ax1.set_title('Approximation')
+    surf2 = ax2.plot_trisurf(triang, u_ex[:, 0], cmap = cm.coolwarm, linewidth = 0, antialiased = False)
+    surf2.set_rasterized(True)                                                     # The surface is embedded as an image in the EPS file.
+    ax2.set_zlim([min_val, max_val])
+    ax2.set_title('Theoretical Solution')
 
     ## Create the graphs.
-    for k in np.arange(0, t+1, step):
+    for k in range(0, t+1, step):
         if k >= t:
             k = t - 1
-        fig, (ax1, ax2) = plt.subplots(1, 2, subplot_kw = {"projection": "3d"}, figsize = (10, 5))
         tin = float(T[k])
-        plt.suptitle('Solution at t = %1.3f s.' %tin)
-        ax1.plot_trisurf(p[:, 0], p[:, 1], u_ap[:, k], triangles = tt, cmap = cm.coolwarm, linewidth = 0, antialiased = False)
-        ax1.set_zlim([min_val, max_val])
-        ax1.set_title('Approximation')
-        ax2.plot_trisurf(p[:, 0], p[:, 1], u_ex[:, k], triangles = tt, cmap = cm.coolwarm, linewidth = 0, antialiased = False)
-        ax2.set_zlim([min_val, max_val])
-        ax2.set_title('Theoretical Solution')
+        fig.suptitle('Solution at t = %1.3f s.' %tin)
+        update_surface(surf1, triang, u_ap[:, k])
+        update_surface(surf2, triang, u_ex[:, k])
         nok = nom + '_' + str(format(T[k], '.2f'))
-        plt.savefig(nok + 's.png')
-        plt.savefig(nok + 's.eps', format = 'eps')
-        plt.close()
+        fig.savefig(nok + 's.png')
+        fig.savefig(nok + 's.eps', format = 'eps', dpi = 150)
+    plt.close(fig)
 
 
 def Cloud_Transient_1(p, tt, u_ap, save = False, nom = ''):
@@ -264,50 +287,44 @@ def Cloud_Transient_1(p, tt, u_ap, save = False, nom = ''):
     T       = np.linspace(0, 1, t)
     min_val = u_ap.min()
     max_val = u_ap.max()
+    triang  = Triangulation(p[:, 0], p[:, 1], tt)
 
     fig, (ax1) = plt.subplots(1, 1, subplot_kw = {"projection": "3d"}, figsize = (5, 5))
 
+    ## The surface is created only once; each frame only updates its heights.
+    surf1 = ax1.plot_trisurf(triang, u_ap[:, 0], cmap = cm.coolwarm, linewidth = 0, antialiased = False)
+    ax1.set_zlim([min_val, max_val])
+    ax1.set_title('Approximation')
+    ax1.view_init(90, 270)
+    ax1.set_zticks([])
+
     if save:
         def update_plot(k):
-            k = min(k, t - 1)
-            ax1.clear()
             tin = float(T[k])
 
             fig.suptitle('Solution at t = %1.3f s.' %tin)
-            ax1.plot_trisurf(p[:, 0], p[:, 1], u_ap[:, k], triangles = tt, cmap = cm.coolwarm, linewidth = 0, antialiased = False)
-            ax1.set_zlim([min_val, max_val])
-            ax1.set_title('Approximation')
-            ax1.view_init(90, 270)
-            ax1.set_zticks([])
+            update_surface(surf1, triang, u_ap[:, k])
 
             return fig, 
     
-        ani = FuncAnimation(fig, update_plot, frames = np.arange(0, t+1, step), blit = True)
+        frames = np.unique(np.append(np.arange(0, t, step), t - 1))                # The time levels to draw, always including the last one.
+        ani = FuncAnimation(fig, update_plot, frames = frames, blit = False, cache_frame_data = False)
         ani.save(nom, writer = 'ffmpeg', fps = 10)
-        plt.close()
+        plt.close(fig)
 
     else:
-        for k in np.arange(0, t, step):
+        for k in range(0, t, step):
             tin = float(T[k])
             fig.suptitle('Solution at t = %1.3f s.' %tin)
             
-            ax1.plot_trisurf(p[:, 0], p[:, 1], u_ap[:, k], triangles = tt, cmap = cm.coolwarm, linewidth = 0, antialiased = False)
-            ax1.set_zlim([min_val, max_val])
-            ax1.set_title('Approximation')
-            ax1.view_init(90, 270)
-            ax1.set_zticks([])
+            update_surface(surf1, triang, u_ap[:, k])
 
             plt.pause(0.1)
-            ax1.clear()
 
         tin = float(T[-1])
         fig.suptitle('Solution at t = %1.3f s.' %tin)
         
-        ax1.plot_trisurf(p[:, 0], p[:, 1], u_ap[:, -1], triangles = tt, cmap = cm.coolwarm, linewidth = 0, antialiased = False)
-        ax1.set_zlim([min_val, max_val])
-        ax1.set_title('Approximation')
-        ax1.view_init(90, 270)
-        ax1.set_zticks([])
+        update_surface(surf1, triang, u_ap[:, -1])
         
         plt.pause(0.1)
         plt.close()
@@ -335,21 +352,26 @@ def Cloud_Transient_Steps_1(p, tt, u_ap, nom = ''):
     T        = np.linspace(0, 1, t)
     min_val  = u_ap.min()
     max_val  = u_ap.max()
+    triang   = Triangulation(p[:, 0], p[:, 1], tt)
+
+    ## Create the figure only once.
+    fig, (ax1) = plt.subplots(1, 1, subplot_kw = {"projection": "3d"}, figsize = (5, 5))
+    surf1 = ax1.plot_trisurf(triang, u_ap[:, 0], cmap = cm.coolwarm, linewidth = 0, antialiased = False)
+    surf1.set_rasterized(True)                                                     # The surface is embedded as an image in the EPS file.
+    ax1.set_zlim([min_val, max_val])
+    ax1.set_title('Approximation')
+    ax1.view_init(90, 270)
+    ax1.set_zticks([])
 
     ## Create the graph.
-    for k in np.arange(0, t+1, step):
+    for k in range(0, t+1, step):
         k = min(k, t - 1)
-        fig, (ax1) = plt.subplots(1, 1, subplot_kw = {"projection": "3d"}, figsize = (5, 5))
         tin = float(T[k])
         
-        plt.suptitle('Solution at t = %1.3f s.' %tin)
-        ax1.plot_trisurf(p[:, 0], p[:, 1], u_ap[:, k], triangles = tt, cmap = cm.coolwarm, linewidth = 0, antialiased = False)
-        ax1.set_zlim([min_val, max_val])
-        ax1.set_title('Approximation')
-        ax1.view_init(90, 270)
-        ax1.set_zticks([])
+        fig.suptitle('Solution at t = %1.3f s.' %tin)
+        update_surface(surf1, triang, u_ap[:, k])
         
         nok = nom + '_' + str(format(T[k], '.2f'))
-        plt.savefig(nok + 's.png')
-        plt.savefig(nok + 's.eps', format = 'eps')
-        plt.close()
\ No newline at end of file
+        fig.savefig(nok + 's.png')
+        fig.savefig(nok + 's.eps', format = 'eps', dpi = 150)
+    plt.close(fig)
@@ -19,7 +19,7 @@ Last Modification:
 ## Library importation.
 import numpy as np
 from scipy.spatial import KDTree
-from joblib import Parallel, delayed
+from numba import njit, prange, vectorize
 
 def Triangulation(p, tt, nvec):
     """
@@ -39,15 +39,18 @@ def Triangulation(p, tt, nvec):
     m   = len(p[:, 0])                                                              # The size if the triangulation is obtained.
     vec = np.zeros([m, nvec], dtype=int)-1                                          # The array for the neighbors is initialized.
 
+    ## Edges of the triangulation.
+    tt   = np.asarray(tt, dtype = np.int64)                                         # Triangles as integer indices.
+    src  = tt[:, [0, 0, 1, 1, 2, 2]].ravel()                                        # Every vertex of each triangle, twice.
+    dst  = tt[:, [1, 2, 0, 2, 0, 1]].ravel()                                        # The other two vertices of the same triangle.
+    key  = np.unique(src[src != dst]*m + dst[src != dst])                           # Unique pairs, sorted by node and then by neighbor.
+    src  = key//m                                                                   # Central node of each pair.
+    dst  = key%m                                                                    # Neighbor of each pair.
+
     ## Neighbor search.
-    for i in np.arange(m):                                                          # For each of the nodes.
-        kn    = np.argwhere(tt == i)                                                # Search in which triangles the node appears.
-        vec2  = np.setdiff1d(tt[kn[:, 0]], i)                                       # Neighbors are stored inside vec2.
-        vec2  = np.vstack([vec2])                                                   # Convert vec2 to a column.
-        nvec2 = sum(vec2[0, :] != -1)                                               # The number of neighbors of the node is calculated.
-        nnvec = np.minimum(nvec, nvec2)                                             # The real number of neighbors.
-        for j in np.arange(nnvec):                                                  # For each of the nodes.
-            vec[i, j] = vec2[0, j]                                                  # Neighbors are saved.
+    rank = np.arange(len(key)) - np.searchsorted(src, src)                          # Position of each neighbor in the list of its node.
+    keep = rank < nvec                                                              # Only the first nvec neighbors are kept.
+    vec[src[keep], rank[keep]] = dst[keep]                                          # Neighbors are saved.
     return vec
 
 def Cloud(p, nvec):
@@ -63,11 +66,14 @@ def Cloud(p, nvec):
         vec         m x nvec        ndarray         Array with matching neighbors of each node.
     """
 
+    ## KDTree shared by both searches.
+    tree = KDTree(p[:, :2])                                                         # Create a KDTree using the x and y coordinates.
+
     ## Delta computation.
-    dist = find_distances(p, mode = 2)
+    dist = find_distances(p, mode = 3, tree = tree)
 
     ## Neighbor search.
-    vec = find_neighbors(p, dist, nvec, mode = 3)
+    vec = find_neighbors(p, dist, nvec, mode = 3, tree = tree)
 
     return vec
 
@@ -85,14 +91,39 @@ def CloudAdv(p, a, b, nvec):
     """
 
     ## Delta computation.
-    dist = find_distances(p, mode = 2)
+    dist = find_distances(p, mode = 3)
 
     ## Neighbor search.
     vec = find_neighbors_adv(p, dist, a, b, nvec)
 
     return vec
 
-def find_distances(p, mode = 2):
+def build_neighbor_csr(vec):
+    """
+    build_neighbor_csr
+    Function to store the neighbors of each node in a compressed sparse row (CSR) layout.
+    The neighbors of node i are indices[indptr[i]:indptr[i+1]].
+    
+    Input:
+        vec         m x nvec        ndarray         Array with matching neighbors of each node.
+    
+    Output:
+        indptr      m + 1           ndarray         Position of the first neighbor of each node in indices.
+        indices     nnz             ndarray         Neighbors of all the nodes, stored consecutively.
+    """
+
+    ## Variable initialization.
+    vec     = np.ascontiguousarray(vec, dtype = np.int32)                           # Neighbors as integer indices.
+    valid   = vec != -1                                                             # Mask with the existing neighbors.
+
+    ## CSR structure.
+    indptr  = np.zeros(len(vec[:, 0]) + 1, dtype = np.int32)                        # indptr initialization with zeros.
+    indptr[1:] = np.cumsum(np.count_nonzero(valid, axis = 1))                       # Cumulative number of neighbors.
+    indices = vec[valid]                                                            # The existing neighbors, row by row.
+
+    return indptr, indices
+
+def find_distances(p, mode = 3, workers = -1, tree = None):
     """
     find_distances
     Function to find the distances between all the give nodes.
@@ -101,7 +132,10 @@ def find_distances(p, mode = 2):
         p           m x 3           ndarray         Array with the coordinates of the nodes and a flag for the boundary.
         mode                        integer         Choose the way to compute the distances:
                                                     1: brute force
-                                                    2: optimized (default)
+                                                    2: optimized
+                                                    3: KDTree (default)
+        workers                     integer         Number of threads used by the KDTree query (Default: -1, all the cores).
+        tree                        KDTree          KDTree of the nodes, used by the KDTree mode (Default: None, it is created).
     
     Output:
         dist                        float           The maximum distance between two consecutive nodes.
@@ -112,30 +146,40 @@ def find_distances(p, mode = 2):
 
     if mode == 1:
         ## Brute Force
-        dmin = np.zeros([m, 1]) + 10                                                # dmin initialization with a "big" value.
-        for i in np.arange(m):                                                      # For each of the nodes.
+        dmin = np.zeros([m, 1]) + 100                                               # dmin initialization with a "big" squared value.
+        for i in range(m):                                                          # For each of the nodes.
             x    = p[i, 0]                                                          # x coordinate of the central node.
             y    = p[i, 1]                                                          # y coordinate of the central node.
-            for j in np.arange(m):                                                  # For all the nodes.
+            for j in range(m):                                                      # For all the nodes.
                 if i != j:                                                          # If the the node is different to the central one.
                     x1 = p[j, 0]                                                    # x coordinate of the possible neighbor.
                     y1 = p[j, 1]                                                    # y coordinate of the possible neighbor.
-                    d  = np.sqrt((x - x1)**2 + (y - y1)**2)                         # Distance from the possible neighbor to the central node.
+                    d  = (x - x1)*(x - x1) + (y - y1)*(y - y1)                      # Squared distance from the possible neighbor to the central node.
                     dmin[i] = min(dmin[i], d)                                       # Look for the distance to the closest node.
-        dist = (3/2)*np.max(dmin)                                                   # The distance is the maximum distance between two consecutive nodes.
+        dist = (3/2)*np.sqrt(np.max(dmin))                                          # The distance is the maximum distance between two consecutive nodes.
 
     if mode == 2:
         ## Optimized.
-        p_expanded    = np.expand_dims(p, axis=1)                                   # Expand p to use vectorized operations.
-        differences   = p_expanded - p                                              # The distance between each node and all the others is computed.
-        distances     = np.sum(differences**2, axis=2)                              # The sum x^2 + y^2 is perform to compute the Euclidean norm.
-        np.fill_diagonal(distances, np.inf)                                         # Distances to the self node are state as infinity and not zero.
-        min_distances = np.sqrt(np.min(distances, axis=1))                          # Look for the distance to the closest node.
-        dist          = (3/2)*np.max(min_distances)                                 # The distance is the maximum distance between two consecutive nodes.
+        B             = 512                                                         # Number of nodes processed at once.
+        min_distances = np.empty(m)                                                 # Squared distance from each node to the closest one.
+        for s in range(0, m, B):                                                    # For each block of nodes.
+            e             = min(s + B, m)                                           # Last node of the block.
+            differences   = p[s:e, None, :2] - p[None, :, :2]                       # The distance between the nodes of the block and all the others is computed.
+            distances     = np.einsum('ijk,ijk->ij', differences, differences)      # The sum x^2 + y^2 is perform to compute the Euclidean norm.
+            distances[np.arange(e - s), np.arange(s, e)] = np.inf                   # Distances to the self node are state as infinity and not zero.
+            min_distances[s:e] = np.min(distances, axis=1)                          # Look for the squared distance to the closest node.
+        dist          = (3/2)*np.sqrt(np.max(min_distances))                        # The distance is the maximum distance between two consecutive nodes.
+
+    if mode == 3:
+        ## KDTree.
+        if tree is None:                                                            # If no KDTree was given.
+            tree = KDTree(p[:, :2])                                                 # Create a KDTree using the x and y coordinates.
+        d, _ = tree.query(p[:, :2], k = 2, workers = workers)                       # The closest node to each node, besides itself.
+        dist = (3/2)*np.max(d[:, 1])                                                # The distance is the maximum distance between two consecutive nodes.
     
     return dist
 
-def find_neighbors(p, dist, nvec, mode = 2):
+def find_neighbors(p, dist, nvec, mode = 3, workers = -1, tree = None):
     """
     find_neighbors
     Function to find all the neighbors of a node withing a given distance.
@@ -146,71 +190,66 @@ def find_neighbors(p, dist, nvec, mode = 2):
         nvec                        integer         Maximum number of neighbors.
         mode                        integer         Choose the way to compute the distances:
                                                     1: brute force
-                                                    2: optimized (default)
+                                                    2: optimized
+                                                    3: KDTree (default)
+        workers                     integer         Number of threads used by the KDTree query (Default: -1, all the cores).
+        tree                        KDTree          KDTree of the nodes, used by the KDTree mode (Default: None, it is created).
     
     Output:
         vec         m x nvec        ndarray         Array with matching neighbors of each node.
     """
 
     ## Variable initialization.
-    m    = len(p[:, 0])                                                             # The size if the triangulation is obtained.
-    vec  = np.zeros([m, nvec], dtype = int) - 1                                     # The array for the neighbors is initialized.
+    m     = len(p[:, 0])                                                            # The size if the triangulation is obtained.
+    vec   = np.zeros([m, nvec], dtype = int) - 1                                    # The array for the neighbors is initialized.
+    dist2 = dist*dist                                                               # Squared radius, to compare squared distances.
 
     if mode == 1:
         ## Brute Force
-        for i in np.arange(m):                                                      # For each of the nodes.
-            x, y  = p[i, 0], p[i, 1]                                                # x, y coordinates of the central node.
-            temp_neighbors = []                                                     # Create an empty array for neighbors.
-            for j in np.arange(m):                                                  # For all the interior nodes.
-                if i != j:                                                          # Check that we are not working with the central node.
-                    x1, y1 = p[j, 0], p[j, 1]                                       # x, y coordinates of the possible neighbor.
-                    d = np.sqrt((x - x1)**2 + (y - y1)**2)                          # Distance from the possible neighbor to the central node.
-                    if d < dist:                                                    # If the distance is smaller or equal to the tolerance distance.
-                        temp_neighbors.append((d, j))                               # Store the neighbor node.
-            temp_neighbors.sort()                                                   # Sort the neighbors by distance.
-            for idx, (d, j) in enumerate(temp_neighbors[:nvec]):                    # For each stored neighbor.
-                vec[i, idx] = j                                                     # Store the neighbor.
+        px = np.ascontiguousarray(p[:, 0], dtype = np.float64)                      # Contiguous x coordinates of the nodes.
+        py = np.ascontiguousarray(p[:, 1], dtype = np.float64)                      # Contiguous y coordinates of the nodes.
+        find_neighbors_top_k(px, py, dist2, nvec, vec)                              # The closest nvec neighbors of each node are stored.
     
     elif mode == 2:
         ## Optimized
-        dx = np.expand_dims(p[:, 0 ], 1) - np.expand_dims(p[:, 0], 0)                # Compute dx between all the nodes.
-        dy = np.expand_dims(p[:, 1 ], 1) - np.expand_dims(p[:, 1], 0)                # Compute dy between all the nodes.
-        radius = np.sqrt(dx**2 + dy**2)                                              # Get the distances from each node to all the others.
-        
-        for i in range(m):                                                           # For each node.
-            neighbors = np.where((radius[i, :] < dist) & (np.arange(m) != i))[0]     # The neighbors are all the nodes within the radius.
-
-            if len(neighbors) > 0:                                                   # If there are more neighbors than the requested.
-                neighbors = neighbors[np.argsort(radius[i, neighbors])][:nvec]       # The neighbors are sorted by distance and only the closest nvec neighbors remains.
-                vec[i, :len(neighbors)] = neighbors                                  # The nvec neighbors are stored.
-            else:
-                neighbors = neighbors[np.argsort(radius[i, neighbors])]              # The neighbors are sorted by distance and only the closest nvec neighbors remains.
-                vec[i, :len(neighbors)] = neighbors                                  # The neighbors are stored.
+        px = np.ascontiguousarray(p[:, 0], dtype = np.float64)                       # Contiguous x coordinates of the nodes.
+        py = np.ascontiguousarray(p[:, 1], dtype = np.float64)                       # Contiguous y coordinates of the nodes.
+        radius = squared_distance(px[:, None], py[:, None], px[None, :], py[None, :])  # Get the squared distances from each node to all the others.
+        np.fill_diagonal(radius, np.inf)                                             # The node itself is never a neighbor.
+
+        k         = min(nvec, m - 1)                                                 # Number of candidates for each node.
+        neighbors = np.argpartition(radius, k - 1, axis = 1)[:, :k]                  # The k closest nodes of each node, unsorted.
+        neighbors = np.sort(neighbors, axis = 1)                                     # Candidates by index, so equal distances keep the lowest index first.
+        d2        = np.take_along_axis(radius, neighbors, axis = 1)                  # Squared distances to the candidates.
+        order     = np.argsort(d2, axis = 1, kind = 'stable')                        # The neighbors are sorted by distance.
+        neighbors = np.take_along_axis(neighbors, order, axis = 1)                   # Candidates sorted by distance.
+        d2        = np.take_along_axis(d2, order, axis = 1)                          # Their squared distances.
+        neighbors[d2 >= dist2] = -1                                                  # Only the nodes within the radius are neighbors.
+        vec[:, :k] = neighbors                                                       # The nvec neighbors are stored.
     
     elif mode == 3:
         # KDTree
-        tree = KDTree(p[:, :2])                                                     # Create a KDTree using the first two columns of p (x and y coordinates).
-        for i in range(m):                                                          # For each node.
-            distances, indices = tree.query(p[i, :2], k = nvec + 1, distance_upper_bound = dist)
-            valid_indices = indices[distances < dist]                               # Filter out invalid distances.
-            valid_indices = valid_indices[valid_indices != i]                       # Remove self from neighbors.
-            vec[i, :min(len(valid_indices), nvec)] = valid_indices[:nvec]           # Store the neighbors.
+        if tree is None:                                                            # If no KDTree was given.
+            tree = KDTree(p[:, :2])                                                 # Create a KDTree using the first two columns of p (x and y coordinates).
+        distances, indices = tree.query(p[:, :2], k = nvec + 1, distance_upper_bound = dist, workers = workers)
+        valid   = (distances < dist) & (indices != np.arange(m)[:, None])           # Filter out invalid distances and the node itself.
+        order   = np.argsort(~valid, axis = 1, kind = 'stable')                     # The valid neighbors are moved to the front, keeping their order.
+        indices = np.take_along_axis(np.where(valid, indices, -1), order, axis = 1) # Neighbors of each node, padded with -1.
+        vec[:]  = indices[:, :nvec]                                                 # Store the neighbors.
 
     return vec
 
-def find_neighbors_adv(p, dist, a, b, nvec, n_jobs = -1):
+def find_neighbors_adv(p, dist, a, b, nvec):
     """
-    find_neighbors
-    Function to find all the neighbors of a node within a given distance, with parallelization.
+    find_neighbors_adv
+    Function to find all the neighbors of a node within a given distance that lie upwind of the direction (a, b).
     
     Input:
         p                   ndarray         Array with the coordinates of the nodes and a flag for the boundary.
         dist                float           Radius distance to look for neighbors.
+        a                   float           x component of the advection direction.
+        b                   float           y component of the advection direction.
         nvec                int             Maximum number of neighbors.
-        mode                int             Choose the way to compute the distances:
-                                                    1: brute force
-                                                    2: optimized (default)
-                                                    3: KDTree
     
     Output:
         vec                 ndarray         Array with matching neighbors of each node.
@@ -219,27 +258,72 @@ def find_neighbors_adv(p, dist, a, b, nvec, n_jobs = -1):
     vec = np.zeros([m, nvec], dtype=int) - 1                                        # The array for the neighbors is initialized.
 
     # Brute Force.
-    vec_rows = Parallel(n_jobs=n_jobs)(delayed(find_neighbors_brute_force)(i, p, a, b, dist, nvec) for i in range(m))
-    vec      = np.array(vec_rows)
+    px  = np.ascontiguousarray(p[:, 0], dtype = np.float64)                         # Contiguous x coordinates of the nodes.
+    py  = np.ascontiguousarray(p[:, 1], dtype = np.float64)                         # Contiguous y coordinates of the nodes.
+    find_neighbors_brute_force(px, py, float(a), float(b), dist**2, nvec, vec)
 
     return vec
 
-def find_neighbors_brute_force(i, p, a, b, dist, nvec):
-    """
-    Helper function for finding neighbors using brute force method.
-    """
-    x, y = p[i, 0], p[i, 1]                                                         # x, y coordinates of the central node.
-    temp_neighbors = []                                                             # Create an empty array for neighbors.
-    for j in np.arange(len(p)):                                                     # For all the nodes.
-        if i != j:                                                                  # Check that we are not working with the central node.
-            x1, y1 = p[j, 0], p[j, 1]                                               # x, y coordinates of the possible neighbor.
-            xt, yt = x1 - x, y1 - y                                                 # Change the "origin" of x and y.
-            di = np.sign(np.dot([xt, yt],[a, b]))                                   # Check the direction between (xt, yt) and (a,b).
-            d  = np.sqrt((x - x1)**2 + (y - y1)**2)                                 # Distance from the possible neighbor to the central node.
-            if di == -1 and d < dist:                                               # If the neighbors are in the correct position and the distance is smaller or equal to the tolerance distance.
-                temp_neighbors.append((d, j))                                       # Store the neighbor node.
-    temp_neighbors.sort()                                                           # Sort the neighbors by distance.
-    neighbors = np.array([j for _, j in temp_neighbors[:nvec]])                     # Extract neighbor indices.
-    vec_row   = np.zeros(nvec, dtype=int) - 1                                       # Initialize row with -1.
-    vec_row[:len(neighbors)] = neighbors                                            # Store the neighbors.
-    return vec_row
\ No newline at end of file
+@njit(parallel = True, cache = True)
+def find_neighbors_brute_force(px, py, a, b, dist2, nvec, vec):
+    """
+    Compiled kernel for finding the upwind neighbors using brute force method.
+    The closest nvec neighbors of each node are kept sorted by distance while the nodes are scanned.
+    The coordinates come as separate contiguous arrays so the inner loop reads them with unit stride.
+    """
+    m = px.shape[0]                                                                 # The number of nodes.
+    for i in prange(m):                                                             # For each of the nodes.
+        best_d = np.full(nvec, np.inf)                                              # Squared distances of the closest neighbors found.
+        best_j = np.full(nvec, -1, dtype = np.int64)                                # Indices of the closest neighbors found.
+        for j in range(m):                                                          # For all the nodes.
+            xt = px[j] - px[i]                                                      # Change the "origin" of x.
+            yt = py[j] - py[i]                                                      # Change the "origin" of y.
+            d2 = xt*xt + yt*yt                                                      # Squared distance from the possible neighbor to the central node.
+            if j != i and xt*a + yt*b < 0 and d2 < dist2:                           # If the neighbor is upwind and within the tolerance distance.
+                insert_neighbor(best_d, best_j, d2, j)                              # Store the neighbor node.
+        for k in range(nvec):                                                       # For each stored neighbor.
+            vec[i, k] = best_j[k]                                                   # Store the neighbor.
+
+@njit(parallel = True, cache = True)
+def find_neighbors_top_k(px, py, dist2, nvec, vec):
+    """
+    Compiled kernel for finding the closest neighbors using brute force method.
+    The closest nvec neighbors of each node are kept sorted by distance while the nodes are scanned.
+    """
+    m = px.shape[0]                                                                 # The number of nodes.
+    for i in prange(m):                                                             # For each of the nodes.
+        best_d = np.full(nvec, np.inf)                                              # Squared distances of the closest neighbors found.
+        best_j = np.full(nvec, -1, dtype = np.int64)                                # Indices of the closest neighbors found.
+        for j in range(m):                                                          # For all the nodes.
+            xt = px[j] - px[i]                                                      # Change the "origin" of x.
+            yt = py[j] - py[i]                                                      # Change the "origin" of y.
+            d2 = xt*xt + yt*yt                                                      # Squared distance from the possible neighbor to the central node.
+            if j != i and d2 < dist2:                                               # If the neighbor is within the tolerance distance.
+                insert_neighbor(best_d, best_j, d2, j)                              # Store the neighbor node.
+        for k in range(nvec):                                                       # For each stored neighbor.
+            vec[i, k] = best_j[k]                                                   # Store the neighbor.
+
+@njit(cache = True)
+def insert_neighbor(best_d, best_j, d2, j):
+    """
+    Helper function to insert a neighbor into the sorted list of the closest neighbors of a node.
+    Neighbors at the same distance keep the order in which they were found.
+    """
+    pos = len(best_d) - 1                                                           # The farthest place of the list.
+    if d2 < best_d[pos]:                                                            # If it is closer than the farthest one stored.
+        while pos > 0 and best_d[pos - 1] > d2:                                     # The farther neighbors are moved one place.
+            best_d[pos] = best_d[pos - 1]
+            best_j[pos] = best_j[pos - 1]
+            pos        -= 1
+        best_d[pos] = d2                                                            # Store the neighbor node.
+        best_j[pos] = j
+
+@vectorize(['float64(float64, float64, float64, float64)'], target = 'parallel')
+def squared_distance(xi, yi, xj, yj):
+    """
+    Compiled ufunc for the squared distance between the nodes (xi, yi) and (xj, yj).
+    Broadcasting a column against a row fills the whole distance matrix in a single parallel pass.
+    """
+    dx = xi - xj                                                                    # Difference in x.
+    dy = yi - yj                                                                    # Difference in y.
+    return dx*dx + dy*dy
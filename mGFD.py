@@ -19,10 +19,52 @@ Last Modification:
 """
 
 import numpy as np
+from numba import njit, prange
+from scipy import sparse
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+from scipy.sparse.linalg import splu, lsmr
 import Scripts.Gammas as Gammas
 import Scripts.Neighbors as Neighbors
 
-def Stationary(p, phi, f, operator = np.vstack([[0], [0], [2], [0], [2]]), triangulation = False, tt = None, Adv = False):
+def precompute(p, operator = np.vstack([[0], [0], [2], [0], [2], [0]]), triangulation = False, tt = None, Adv = False):
+    '''
+    Neighbor search and Gammas for the unit operators, to be shared by several problems on the same cloud of points.
+    
+    The Gammas only depend on the geometry and are linear in the operator, so the K matrix of any operator (scaled by dt,
+    dt^2 or any coefficient) is assembled from them without repeating the neighbor search or the least-squares systems.
+    
+    Input:
+        p           m x 3           ndarray         Array with the coordinates of the nodes and the flag for boundary or inner node.
+        operator                    ndarray         Array with the weights for the operator, only used for the upwind neighbors.
+                                                        ([D, E, A, B, C, F]).
+                                                        ([0, 0, 2, 0, 2, 0] is the default).
+        triangulation               bool            Select whether or not there is a triangulation available.
+                                                        True: Triangulation available.
+                                                        False: No triangulation available (Default).
+        tt          m x 3           ndarray         Array with the triangulation indexes.
+        Adv                         bool            Select whether or not an upwind stencil is used (Default: False).
+    
+    Output:
+        vec         m x o           ndarray         Array with the correspondence of the o neighbors of each node.
+        Gamma                       GammaData       Gammas for the unit operators.
+    '''
+    nvec = 8                                                                        # Maximum number of neighbors for each node.
+
+    ## Neighbor search for all the nodes.
+    if triangulation == True:                                                       # If there are triangles available.
+        vec = Neighbors.Triangulation(p, tt, nvec)                                  # Neighbor search with the proper routine.
+    elif Adv == True:                                                               # If there are no triangles available and upwind required.
+        vec = Neighbors.CloudAdv(p, operator[0][0], operator[1][0], nvec)           # Neighbor search with the proper routine.
+    else:                                                                           # All the other cases.
+        vec = Neighbors.Cloud(p, nvec)                                              # Neighbor search with the proper routine.
+
+    ## Gamma computation.
+    Gamma = Gammas.Basis(p, vec)                                                    # Gammas for the unit operators.
+
+    return vec, Gamma
+
+
+def Stationary(p, phi, f, operator = np.vstack([[0], [0], [2], [0], [2], [0]]), triangulation = False, tt = None, Adv = False, precomp = None, dtype = np.float64):
     '''
     Numerical solution of partial differential equations with no time derivatives using a Meshless Generalized Finite Difference Scheme.
     
@@ -41,6 +83,8 @@ def Stationary(p, phi, f, operator = np.vstack([[0], [0], [2], [0], [2]]), trian
                                                         True: Triangulation available.
                                                         False: No triangulation available (Default).
         tt          m x 3           ndarray         Array with the triangulation indexes.
+        precomp                     tuple           Output of precompute, (vec, Gamma), to skip the neighbor search and Gammas (Default: None).
+        dtype                       dtype           Floating point type for the solution; the system is solved in double precision (Default: np.float64).
     
     Output:
         u_ap        m               ndarray         Array with the approximation computed by the routine.
@@ -51,10 +95,10 @@ def Stationary(p, phi, f, operator = np.vstack([[0], [0], [2], [0], [2]]), trian
     # Variable initialization
     m      = len(p[:, 0])                                                           # The total number of nodes is calculated.
     nvec   = 8                                                                      # Maximum number of neighbors for each node.
-    u_ap   = np.zeros([m])                                                          # u_ap initialization with zeros.
-    u_ex   = np.zeros([m])                                                          # u_ex initialization with zeros.
-    boun_n = (p[:, 2] == 1) | (p[:, 2] == 2)                                        # Save the boundary nodes.
-    inne_n = p[:, 2] == 0                                                           # Save the inner nodes.
+    u_ap   = np.zeros([m], dtype = dtype)                                           # u_ap initialization with zeros.
+    u_ex   = np.zeros([m], dtype = dtype)                                           # u_ex initialization with zeros.
+    boun_n = np.flatnonzero((p[:, 2] == 1) | (p[:, 2] == 2))                        # Save the indices of the boundary nodes.
+    inne_n = np.flatnonzero(p[:, 2] == 0)                                           # Save the indices of the inner nodes.
 
     # Values for the velocities form the operator
     if Adv == True:                                                                 # If an Upwind stencil is requested.
@@ -62,10 +106,13 @@ def Stationary(p, phi, f, operator = np.vstack([[0], [0], [2], [0], [2]]), trian
         b = operator[1][0]                                                          # Value of the velocity on y.
 
     # Boundary conditions
-    u_ap[boun_n] = phi(p[boun_n, 0], p[boun_n, 1])                                  # The boundary condition is assigned.
+    phi_n = phi(p[:,0], p[:,1])                                                     # phi is evaluated only once, on all the nodes.
+    u_ap[boun_n] = phi_n[boun_n]                                                    # The boundary condition is assigned.
     
     ## Neighbor search for all the nodes.
-    if triangulation == True:                                                       # If there are triangles available.
+    if precomp is not None:                                                         # If the neighbors and Gammas were precomputed.
+        vec, Gamma = precomp                                                        # The precomputed values are used.
+    elif triangulation == True:                                                     # If there are triangles available.
         vec = Neighbors.Triangulation(p, tt, nvec)                                  # Neighbor search with the proper routine.
     elif Adv == True:                                                               # If there are no triangles available and upwind required.
         vec = Neighbors.CloudAdv(p, a, b, nvec)                                     # Neighbor search with the proper routine.
@@ -74,21 +121,28 @@ def Stationary(p, phi, f, operator = np.vstack([[0], [0], [2], [0], [2]]), trian
 
     # Computation of Gamma values
     L = operator[:-1]                                                               # The values of the differential operator are assigned.
-    K = Gammas.Cloud(p, vec, L)                                                     # K computation with the required Gammas.
-    R = Gammas.RHS(p, boun_n, inne_n, phi, f)                                       # Right-hand side of the equation.
+    if precomp is not None:                                                         # If the Gammas were precomputed.
+        K = Gammas.Assemble(Gamma, L)                                               # K is a combination of the Gammas for the unit operators.
+    else:                                                                           # If there are no Gammas available.
+        K = Gammas.Cloud(p, vec, L)                                                 # K computation with the required Gammas.
+    R = Gammas.RHS(p, boun_n, inne_n, phi, f, phi_n)                                # Right-hand side of the equation.
     
     # A Generalized Finite Differences Method
-    K = np.linalg.pinv(K)
-    un  = K@R
+    try:                                                                            # The sparse system K un = R is solved.
+        un = splu(K.tocsc()).solve(R)                                               # Sparse LU factorization of K and solution.
+    except RuntimeError:                                                            # If K is singular.
+        un = lsmr(K, R)[0]                                                          # Least-squares solution, computed iteratively.
+    if not np.all(np.isfinite(un)):                                                 # If K is nearly singular and the factors overflowed.
+        un = lsmr(K, R)[0]                                                          # Least-squares solution, computed iteratively.
     u_ap[inne_n] = un[inne_n]
     
     # Theoretical Solution
-    u_ex = phi(p[:,0], p[:,1])                                                      # The theoretical solution is computed.
+    u_ex[:] = phi_n                                                                 # The theoretical solution is phi on all the nodes.
 
     return u_ap, u_ex, vec
 
 
-def TimeDerivative1(p, f, t, coef, operator = np.vstack([[0], [0], [2], [0], [2]]), triangulation = False, tt = [], implicit = False, lam = 0.5, Adv = False):
+def TimeDerivative1(p, f, t, coef, operator = np.vstack([[0], [0], [2], [0], [2], [0]]), triangulation = False, tt = [], implicit = False, lam = 0.5, Adv = False, precomp = None, dtype = np.float64, exact = None):
     """
     Numerical solution of partial differential equations with first-order time derivatives using a Meshless Generalized Finite Difference Scheme.
     
@@ -113,6 +167,9 @@ def TimeDerivative1(p, f, t, coef, operator = np.vstack([[0], [0], [2], [0], [2]
                                                         False: Explicit scheme used (Default).
         lam                         float           Lambda parameter for the implicit scheme.
                                                         Must be between 0 and 1 (Default: 0.5).
+        precomp                     tuple           Output of precompute, (vec, Gamma), to skip the neighbor search and Gammas (Default: None).
+        dtype                       dtype           Floating point type for K and the solution (Default: np.float64).
+        exact       m x t           ndarray         Theoretical solution, if already available, to skip its computation (Default: None).
     
     Output:
         u_ap        m x t           ndarray         Array with the approximation computed by the routine.
@@ -125,53 +182,79 @@ def TimeDerivative1(p, f, t, coef, operator = np.vstack([[0], [0], [2], [0], [2]
     nvec = 8                                                                        # Maximum number of neighbors for each node.
     T    = np.linspace(0,1,t)                                                       # Time discretization.
     dt   = T[1] - T[0]                                                              # dt computation.
-    u_ap = np.zeros([m,t])                                                          # u_ap initialization with zeros.
-    u_ex = np.zeros([m,t])                                                          # u_ex initialization with zeros.
-    boun_n = (p[:, 2] == 1) | (p[:, 2] == 2)                                        # Save the boundary nodes.
-    inne_n = p[:, 2] == 0                                                           # Save the inner nodes.
+    u_ap = np.zeros([m,t], dtype = dtype)                                           # u_ap initialization with zeros.
+    boun_n = np.flatnonzero((p[:, 2] == 1) | (p[:, 2] == 2))                        # Save the indices of the boundary nodes.
+    inne_n = np.flatnonzero(p[:, 2] == 0)                                           # Save the indices of the inner nodes.
 
     # Values for the velocities form the operator
     if Adv == True:                                                                 # If an Upwind stencil is requested.
-        a = L[0]                                                                    # Value of the velocity on x.
-        b = L[1]                                                                    # Value of the velocity on y.
+        a = operator[0][0]                                                          # Value of the velocity on x.
+        b = operator[1][0]                                                          # Value of the velocity on y.
     
+    # Theoretical Solution
+    if exact is None:                                                               # If the theoretical solution is not available.
+        u_ex = np.empty([m,t], dtype = dtype)                                       # u_ex initialization.
+        u_ex[:, :] = f(p[:, 0:1], p[:, 1:2], T, coef)                               # The theoretical solution is computed on all the time steps.
+    else:                                                                           # If the theoretical solution was given.
+        u_ex = exact                                                                # The given theoretical solution is used.
+
     # Boundary conditions.
-    for k in np.arange(t):                                                          # For each time step.
-        u_ap[boun_n, k] = f(p[boun_n, 0], p[boun_n, 1], T[k], coef)                 # The boundary condition is assigned.
+    u_ap[boun_n, :] = u_ex[boun_n, :]                                               # The boundary condition is assigned on all the time steps.
   
     # Initial condition
-    u_ap[:, 0] = f(p[:, 0], p[:, 1], T[0], coef)                                    # The initial condition is assigned.
+    u_ap[:, 0] = u_ex[:, 0]                                                         # The initial condition is assigned.
     
     ## Neighbor search for all the nodes.
-    if triangulation == True:                                                       # If there are triangles available.
+    if precomp is not None:                                                         # If the neighbors and Gammas were precomputed.
+        vec, Gamma = precomp                                                        # The precomputed values are used.
+    elif triangulation == True:                                                     # If there are triangles available.
         vec = Neighbors.Triangulation(p, tt, nvec)                                  # Neighbor search with the proper routine.
     elif Adv == True:                                                               # If there are no triangles available and upwind required.
-        vec = Neighbors.CloudAdv(p, nvec)                                           # Neighbor search with the proper routine.
+        vec = Neighbors.CloudAdv(p, a, b, nvec)                                     # Neighbor search with the proper routine.
     else:                                                                           # All the other cases.
         vec = Neighbors.Cloud(p, nvec)                                              # Neighbor search with the proper routine.
 
     # Gamma computation.
     L = dt*operator[:-1]                                                            # The values of the differential operator are assigned.
-    K = Gammas.Cloud(p, vec, L)                                                     # K computation with the required Gammas.
+    if precomp is not None:                                                         # If the Gammas were precomputed.
+        K = Gammas.Assemble(Gamma, L)                                               # K is a combination of the Gammas for the unit operators.
+    else:                                                                           # If there are no Gammas available.
+        K = Gammas.Cloud(p, vec, L)                                                 # K computation with the required Gammas.
+    K = K.astype(dtype)                                                             # K in the requested precision.
     
     # Generalized Finite Differences Method
     if implicit == False:                                                           # For the explicit scheme.
-        K2 = np.identity(m) + K                                                     # Explicit formulation of K.
+        perm = reverse_cuthill_mckee(K)                                             # Node ordering that keeps the neighbors close in memory.
+        Kc, Kd = ell_layout(K[perm][:, perm])                                       # K with the nodes reordered, in padded rows.
+        inne = np.flatnonzero(p[perm, 2] == 0)                                      # Inner nodes in the new ordering.
+        bnod = np.flatnonzero((p[perm, 2] == 1) | (p[perm, 2] == 2))                # Boundary nodes in the new ordering.
+        boun = perm[bnod]                                                           # Original index of those boundary nodes.
+        u1   = u_ap[perm,0]                                                         # Contiguous copy of the previous time-level.
+        un   = np.empty(m, dtype = dtype)                                           # Contiguous buffer for the new time-level.
+
+        for k in range(1,t):                                                        # For each of the time steps.
+            un[bnod] = u_ap[boun,k]                                                 # The boundary condition is assigned.
+            explicit_step(Kc, Kd, 1.0, u1, 0.0, u1, inne, un)                       # The new time-level is computed.
+            u_ap[perm,k] = un                                                       # Save the computed solution in the original ordering.
+            u1, un = un, u1                                                         # The new time-level becomes the previous one.
     else:                                                                           # For the implicit scheme.
-        K2 = np.linalg.pinv(np.identity(m) - (1-lam)*K)@(np.identity(m) + lam*K)    # Implicit formulation of K.
+        Ki = sparse.diags((p[:, 2] == 0).astype(dtype))@K                           # Only the inner nodes follow the equation.
+        K1 = splu((sparse.identity(m, dtype = dtype) - (1-lam)*Ki).tocsc())         # LU factorization of the implicit part, computed only once.
+        Kc, Kd = ell_layout(lam*K)                                                  # Gammas of the explicit part of the scheme, in padded rows.
+        u1 = u_ap[:,0].copy()                                                       # Contiguous copy of the previous time-level.
+        R  = np.empty(m, dtype = dtype)                                             # Right-hand side, allocated only once.
 
-    for k in np.arange(1,t):                                                        # For each of the time steps.
-        un = K2@u_ap[:,k-1]                                                         # The new time-level is computed.
-        u_ap[inne_n,k] = un[inne_n]                                                 # Save the computed solution.
-        
-    # Theoretical Solution
-    for k in np.arange(t):                                                          # For all the time steps.
-        u_ex[:, k] = f(p[:, 0], p[:, 1], T[k], coef)                                # The theoretical solution is computed.
+        for k in range(1,t):                                                        # For each of the time steps.
+            R[boun_n] = u_ap[boun_n,k]                                              # The boundary nodes keep their boundary condition.
+            explicit_step(Kc, Kd, 1.0, u1, 0.0, u1, inne_n, R)                      # Right-hand side for the inner nodes, in a single pass.
+            un = K1.solve(R)                                                        # The new time-level is computed.
+            u_ap[inne_n,k] = un[inne_n]                                             # Save the computed solution.
+            u1 = un                                                                 # The new time-level becomes the previous one.
 
     return u_ap, u_ex, vec
 
 
-def TimeDerivative2(p, f, g, t, coef, operator = np.vstack([[0], [0], [2], [0], [2]]), triangulation = False, tt = None, implicit = False, lam = 0.5, Adv = False):
+def TimeDerivative2(p, f, g, t, coef, operator = np.vstack([[0], [0], [2], [0], [2], [0]]), triangulation = False, tt = None, implicit = False, lam = 0.5, Adv = False, precomp = None, dtype = np.float64, exact = None):
     '''
     Numerical solution of partial differential equations with second-order time derivatives using a Meshless Generalized Finite Difference Scheme.
     
@@ -197,6 +280,9 @@ def TimeDerivative2(p, f, g, t, coef, operator = np.vstack([[0], [0], [2], [0],
                                                         False: Explicit scheme used (Default).
         lam                         float           Lambda parameter for the implicit scheme.
                                                         Must be between 0 and 1 (Default: 0.5).
+        precomp                     tuple           Output of precompute, (vec, Gamma), to skip the neighbor search and Gammas (Default: None).
+        dtype                       dtype           Floating point type for K and the solution (Default: np.float64).
+        exact       m x t           ndarray         Theoretical solution, if already available, to skip its computation (Default: None).
     
     Output:
         u_ap        m x t           ndarray         Array with the approximation computed by the routine.
@@ -209,57 +295,123 @@ def TimeDerivative2(p, f, g, t, coef, operator = np.vstack([[0], [0], [2], [0],
     nvec   = 8                                                                      # Maximum number of neighbors for each node.
     T      = np.linspace(0, 1, t)                                                   # Time discretization.
     dt     = T[1] - T[0]                                                            # dt computation.
-    u_ap   = np.zeros([m, t])                                                       # u_ap initialization with zeros.
-    u_ex   = np.zeros([m, t])                                                       # u_ex initialization with zeros.
-    boun_n = (p[:, 2] == 1) | (p[:, 2] == 2)                                        # Save the boundary nodes.
-    inne_n = p[:, 2] == 0                                                           # Save the inner nodes.
+    u_ap   = np.zeros([m, t], dtype = dtype)                                        # u_ap initialization with zeros.
+    boun_n = np.flatnonzero((p[:, 2] == 1) | (p[:, 2] == 2))                        # Save the indices of the boundary nodes.
+    inne_n = np.flatnonzero(p[:, 2] == 0)                                           # Save the indices of the inner nodes.
 
     # Values for the velocities form the operator
     if Adv == True:                                                                 # If an Upwind stencil is requested.
-        a = L[0]                                                                    # Value of the velocity on x.
-        b = L[1]                                                                    # Value of the velocity on y.
+        a = operator[0][0]                                                          # Value of the velocity on x.
+        b = operator[1][0]                                                          # Value of the velocity on y.
+
+    ## Theoretical Solution
+    if exact is None:                                                               # If the theoretical solution is not available.
+        u_ex = np.empty([m, t], dtype = dtype)                                      # u_ex initialization.
+        u_ex[:, :] = f(p[:, 0:1], p[:, 1:2], T, coef)                               # The theoretical solution is computed on all the time steps.
+    else:                                                                           # If the theoretical solution was given.
+        u_ex = exact                                                                # The given theoretical solution is used.
 
     ## Boundary conditions.
-    for k in np.arange(t):                                                          # For each time step.
-        u_ap[boun_n, k] = f(p[boun_n, 0], p[boun_n, 1], T[k], coef)                 # The boundary condition is assigned.
+    u_ap[boun_n, :] = u_ex[boun_n, :]                                               # The boundary condition is assigned on all the time steps.
 
     ## Initial condition.
-    u_ap[:, 0] = f(p[:, 0], p[:, 1], T[0], coef)                                    # The initial condition is assigned.
+    u_ap[:, 0] = u_ex[:, 0]                                                         # The initial condition is assigned.
     
     ## Neighbor search for all the nodes.
-    if triangulation == True:                                                       # If there are triangles available.
+    if precomp is not None:                                                         # If the neighbors and Gammas were precomputed.
+        vec, Gamma = precomp                                                        # The precomputed values are used.
+    elif triangulation == True:                                                     # If there are triangles available.
         vec = Neighbors.Triangulation(p, tt, nvec)                                  # Neighbor search with the proper routine.
     elif Adv == True:                                                               # If there are no triangles available and upwind required.
-        vec = Neighbors.CloudAdv(p, nvec)                                           # Neighbor search with the proper routine.
+        vec = Neighbors.CloudAdv(p, a, b, nvec)                                     # Neighbor search with the proper routine.
     else:                                                                           # All the other cases.
         vec = Neighbors.Cloud(p, nvec)                                              # Neighbor search with the proper routine.
 
     ## Gamma computation.
     L = (dt**2)*operator[:-1]                                                       # The values of the differential operator are assigned.
-    K = Gammas.Cloud(p, vec, L)                                                     # K computation with the required Gammas.
+    if precomp is not None:                                                         # If the Gammas were precomputed.
+        K = Gammas.Assemble(Gamma, L)                                               # K is a combination of the Gammas for the unit operators.
+    else:                                                                           # If there are no Gammas available.
+        K = Gammas.Cloud(p, vec, L)                                                 # K computation with the required Gammas.
+    K = K.astype(dtype)                                                             # K in the requested precision.
 
+    ## Generalized Finite Differences Method
     if implicit == False:                                                           # For the explicit scheme.
-        K1 = np.identity(m)                                                         # Implicit formulation of K for k = 1.
-        K2 = np.identity(m) + (1/2)*K                                               # Implicit formulation of K for k = 1.
-        K3 = np.identity(m)                                                         # Implicit formulation of K for k = 2, ..., t.
-        K4 = 2*np.identity(m) + K                                                   # Implicit formulation of K for k = 2, ..., t.
+        perm = reverse_cuthill_mckee(K)                                             # Node ordering that keeps the neighbors close in memory.
+        Kc, Kd = ell_layout(K[perm][:, perm])                                       # K with the nodes reordered, in padded rows.
+        inne = np.flatnonzero(p[perm, 2] == 0)                                      # Inner nodes in the new ordering.
+        bnod = np.flatnonzero((p[perm, 2] == 1) | (p[perm, 2] == 2))                # Boundary nodes in the new ordering.
+        boun = perm[bnod]                                                           # Original index of those boundary nodes.
+        u0   = g(p[perm, 0], p[perm, 1], T[1], coef).astype(dtype)                  # Contiguous buffer, first with the initial velocity.
+        u1   = u_ap[perm, 0]                                                        # Contiguous copy of the previous time-level.
+        un   = np.empty(m, dtype = dtype)                                           # Contiguous buffer for the new time-level.
+
+        for k in range(1, t):                                                       # For al time levels.
+            un[bnod] = u_ap[boun, k]                                                # The boundary condition is assigned.
+            if k == 1:                                                              # For the first time level.
+                explicit_step(Kc, (1/2)*Kd, 1.0, u1, dt, u0, inne, un)              # The new time-level is computed.
+            else:                                                                   # For all the other time levels.
+                explicit_step(Kc, Kd, 2.0, u1, -1.0, u0, inne, un)                  # The new time-level is computed.
+            u_ap[perm, k] = un                                                      # Save the computed solution in the original ordering.
+            u0, u1, un = u1, un, u0                                                 # The time-levels are moved one place.
     else:                                                                           # For the implicit scheme.
-        K1 = np.linalg.pinv(np.identity(m) - (1 - lam)*(1/2)*K)                     # Implicit formulation of K for k = 1.
-        K2 = np.identity(m) + lam*(1/2)*K                                           # Implicit formulation of K for k = 1.
-        K3 = np.linalg.pinv(np.identity(m) - (1 - lam)*K)                           # Implicit formulation of K for k = 2, ..., t.
-        K4 = 2*np.identity(m) + lam*K                                               # Implicit formulation of K for k = 2, ..., t.
+        Ki = sparse.diags((p[:, 2] == 0).astype(dtype))@K                           # Only the inner nodes follow the equation.
+        K1 = splu((sparse.identity(m, dtype = dtype) - (1 - lam)*(1/2)*Ki).tocsc()) # LU factorization of the implicit part for k = 1.
+        K3 = splu((sparse.identity(m, dtype = dtype) - (1 - lam)*Ki).tocsc())       # LU factorization of the implicit part for k = 2, ..., t.
+        Kc, Kd = ell_layout(lam*K)                                                  # Gammas of the explicit part of the scheme, in padded rows.
+        u0 = g(p[:, 0], p[:, 1], T[1], coef).astype(dtype)                          # Contiguous buffer, first with the initial velocity.
+        u1 = u_ap[:, 0].copy()                                                      # Contiguous copy of the previous time-level.
+        R  = np.empty(m, dtype = dtype)                                             # Right-hand side, allocated only once.
 
-    ## Generalized Finite Differences Method
-    for k in np.arange(1, t):                                                       # For al time levels.
-        if k == 1:                                                                  # For the first time level.
-            un = K1@(K2@u_ap[:, k - 1] + dt*g(p[:, 0], p[:, 1], T[k], coef))        # The new time-level is computed.
+        for k in range(1, t):                                                       # For al time levels.
+            R[boun_n] = u_ap[boun_n, k]                                             # The boundary nodes keep their boundary condition.
+            if k == 1:                                                              # For the first time level.
+                explicit_step(Kc, (1/2)*Kd, 1.0, u1, dt, u0, inne_n, R)             # Right-hand side for the inner nodes.
+                un = K1.solve(R)                                                    # The new time-level is computed.
+            else:                                                                   # For all the other time levels.
+                explicit_step(Kc, Kd, 2.0, u1, -1.0, u0, inne_n, R)                 # Right-hand side for the inner nodes, in a single pass.
+                un = K3.solve(R)                                                    # The new time-level is computed.
             u_ap[inne_n, k] = un[inne_n]                                            # Save the computed solution.
-        else:                                                                       # For all the other time levels.
-            un = K3@(K4@u_ap[:, k - 1] - u_ap[:, k - 2])                            # The new time-level is computed.
-            u_ap[inne_n, k] = un[inne_n]                                            # Save the computed solution.                
+            u0, u1 = u1, un                                                         # The time-levels are moved one place.
 
-    ## Theoretical Solution
-    for k in np.arange(t):                                                          # For all the time steps.
-        u_ex[:, k] = f(p[:, 0], p[:, 1], T[k], coef)                                # The theoretical solution is computed.
+    return u_ap, u_ex, vec
+
+
+def ell_layout(K):
+    """
+    Padded (ELLPACK) layout of a sparse K matrix, with the same number of entries in every row.
+    The missing entries of a row point to the node itself with a zero weight, so they do not change the products.
+    
+    Input:
+        K           m x m           csr_matrix      Sparse K Matrix with the computed Gammas.
+    
+    Output:
+        cols        m x w           ndarray         Column of each entry of K, with w the largest number of entries in a row.
+        data        m x w           ndarray         Value of each entry of K.
+    """
+    m     = K.shape[0]                                                              # The total number of nodes.
+    count = np.diff(K.indptr)                                                       # Entries of each row.
+    rows  = np.repeat(np.arange(m), count)                                          # Row of each of the entries.
+    pos   = np.arange(K.nnz) - K.indptr[rows]                                       # Place of each entry in its row.
+    cols  = np.repeat(np.arange(m, dtype = np.int32)[:, None], count.max(), axis = 1)
+                                                                                    # The padding points to the node itself.
+    data  = np.zeros(cols.shape, dtype = K.dtype)                                   # The padding has a zero weight.
+    cols[rows, pos] = K.indices                                                     # Columns of the entries.
+    data[rows, pos] = K.data                                                        # Values of the entries.
+    return cols, data
 
-    return u_ap, u_ex, vec
\ No newline at end of file
+
+@njit(parallel = True, cache = True)
+def explicit_step(cols, data, a, u1, b, u0, inne_n, u_out):
+    """
+    Compiled kernel for one explicit time step over the padded rows of K; only the inner nodes, given by their indices, are updated.
+    For each inner node i it computes u_out[i] = a*u1[i] + (K@u1)[i] + b*u0[i], so no matrix is assembled per step.
+    Every row has the same length, so the loop over the entries has a fixed trip count and no indirection through indptr.
+    Every node only writes its own entry of u_out, so the nodes are processed in parallel without races.
+    """
+    for j in prange(len(inne_n)):                                                   # For each of the inner nodes.
+        i = inne_n[j]                                                               # Index of the node.
+        s = a*u1[i] + b*u0[i]                                                       # Contribution of the central node.
+        for k in range(cols.shape[1]):                                              # For each entry in the row of the node.
+            s += data[i, k]*u1[cols[i, k]]                                          # Contribution of the Gammas.
+        u_out[i] = s                                                                # Save the computed solution.
\ No newline at end of file
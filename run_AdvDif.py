@@ -27,64 +27,66 @@ Last Modification:
 
 # Library importation
 import os
-import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
 import numpy as np
 import Scripts.Graph as Graph
 import Scripts.Errors as Errors
+import Scripts.Driver as Driver
 from mGFD import TimeDerivative1
 
-## Create a dictionary to get all the regions in da Data folder.
-def group_files_by_region(files):
-    pattern = re.compile(r'^(.*?)(_p\.csv|_tt\.csv)$')                                      # Look for the files ending in "_p.csv" and "_tt.csv"
-    regions = {}                                                                            # Dictionary for the regions.
-    for file in files:                                                                      # For each of the files in clouds.
-        match = pattern.match(file)                                                         # Check for the match of the pattern with the file.
-        if match:                                                                           # If is a match.
-            region, suffix = match.groups()                                                 # Get the name of the region.
-            if region not in regions:                                                       # If the file haven't been added.
-                regions[region] = {}                                                        # Create an empty entry.
-            regions[region][suffix] = file                                                  # Add the file to the regions.
-    return regions                                                                          # Return the regions dictionary.
-
 ## Process the regions and compute the solutions.
-def process_region(region, files, data_path, results_path, save):
+def process_region(region, files, data_path, results_path, save, force = False):
     print(f'Working on region: {region}')
     if '_p.csv' in files and '_tt.csv' in files:                                            # Check the existence of points and triangles.
         p_file_path  = os.path.join(data_path, files['_p.csv'])                             # Get the file path for the points.
         tt_file_path = os.path.join(data_path, files['_tt.csv'])                            # Get the file path fot the triangles.
 
-        p  = np.genfromtxt(p_file_path,  delimiter = ',', skip_header = 0)                  # Load the coordinates of the points.
-        tt = np.genfromtxt(tt_file_path, delimiter = ',', skip_header = 0)                  # Load the triangles correspondence.
+        p  = Driver.load_data(p_file_path)                                                  # Load the coordinates of the points.
+        tt = Driver.load_data(tt_file_path, np.int32)                                       # Load the triangles correspondence.
+
+        theoretical_solution_path = os.path.join(results_path, 'Advection-Diffusion', region, 'Theoretical Solution.npy')
+                                                                                            # Set the name of the file for the theoretical solution.
+        key = Driver.exact_key([v, a, b], t, np.float32, p_file_path)                       # Everything the theoretical solution depends on.
+        exact = None                                                                        # The theoretical solution is computed by default.
+        if not force:                                                                       # If a saved theoretical solution can be used.
+            exact = Driver.load_exact(theoretical_solution_path, key)                       # Map it, if it was computed for the same problem.
 
-        u_ap, u_ex, vec = TimeDerivative1(p, f, t, [v, a, b], operator = L, triangulation = False, tt = [], implicit = False, lam = 0.5)
+        u_ap, u_ex, vec = TimeDerivative1(p, f, t, [v, a, b], operator = L, triangulation = False, tt = [], implicit = False, lam = 0.5, dtype = np.float32, exact = exact)
                                                                                             # Compute the numerical solution.
 
         er = Errors.Cloud_Transient(p, vec, u_ap, u_ex)                                     # Compute the error.
-        print(f'\tError: {np.mean(er)}')                                                    # Print the mean of the error.
+        mean_er = float(np.mean(er))                                                        # Mean of the error, computed only once.
+        print(f'\tError: {mean_er}')                                                        # Print the mean of the error.
 
-        if save:                                                                            # If we are going to save.
-            os.makedirs(os.path.join(results_path, 'Advection-Diffusion', region), exist_ok = True)
+        with ThreadPoolExecutor(max_workers = 1) as io_pool:                                # Thread for the binary files, joined at the end of the region.
+            writes = []                                                                     # Pending writes.
+            if save:                                                                        # If we are going to save.
+                os.makedirs(os.path.join(results_path, 'Advection-Diffusion', region), exist_ok = True)
                                                                                             # Ensure the directory exists.
-            error_path = os.path.join(results_path, 'Advection-Diffusion', region, 'Error.txt')
+                error_path = os.path.join(results_path, 'Advection-Diffusion', region, 'Error.txt')
                                                                                             # Set the name of the file for the error.
-            with open(error_path, 'w') as file:                                             # Create the file.
-                file.write(str(np.mean(er)))                                                # Save the error.
+                with open(error_path, 'w') as file:                                         # Create the file.
+                    file.write(str(mean_er))                                                # Save the error.
 
-            computed_solution_path = os.path.join(results_path, 'Advection-Diffusion', region, 'Computed Solution.csv')
+                computed_solution_path = os.path.join(results_path, 'Advection-Diffusion', region, 'Computed Solution.npy')
                                                                                             # Set the name of the file for the computed solution.
-            np.savetxt(computed_solution_path, u_ap, delimiter = ',', fmt = '%.8f')         # Save the computed solution.
+                writes.append(io_pool.submit(np.save, computed_solution_path, u_ap))        # Save the computed solution while the graphs are drawn.
 
-            theoretical_solution_path = os.path.join(results_path, 'Advection-Diffusion', region, 'Theoretical Solution.csv')
-                                                                                            # Set the name of the file for the theoretical solution.
-            np.savetxt(theoretical_solution_path, u_ex, delimiter = ',', fmt = '%.8f')      # Save the theoretical solution.
+                if exact is None:                                                           # If the theoretical solution was computed.
+                    writes.append(io_pool.submit(Driver.save_exact, theoretical_solution_path, key, u_ex))
+                                                                                            # Save the theoretical solution while the graphs are drawn.
 
-            plot_path = os.path.join(results_path, 'Advection-Diffusion', region, 'Solution')
+                plot_path = os.path.join(results_path, 'Advection-Diffusion', region, 'Solution')
                                                                                             # Set the name for the resulting graphs.
-            Graph.Cloud_Transient_Steps(p, tt, u_ap, u_ex, nom = plot_path)                 # Save the resulting graphs.
+                Graph.Cloud_Transient_Steps(p, tt, u_ap, u_ex, nom = plot_path)             # Save the resulting graphs.
 
-        plot_path = os.path.join(results_path, 'Advection-Diffusion', region, 'Solution.mp4')
+            plot_path = os.path.join(results_path, 'Advection-Diffusion', region, 'Solution.mp4')
                                                                                             # Set the name for the resulting video.
-        Graph.Cloud_Transient(p, tt, u_ap, u_ex, save = Save, nom = plot_path)              # Save the resulting video.
+            Graph.Cloud_Transient(p, tt, u_ap, u_ex, save = Save, nom = plot_path)          # Save the resulting video.
+
+            for write in writes:                                                            # For each of the writes.
+                write.result()                                                              # Wait for the write and raise its errors, if any.
 
 # Read the files with the data of all the regions in the Data folder.
 ## Define the paths for the data and the results for unstructured clouds.
@@ -95,14 +97,6 @@ results_clouds = 'Results/Clouds/'
 data_holes     = 'Data/Holes/'                                                              # Folder with the data of the regions.
 results_holes  = 'Results/Holes/'                                                           # Folder to save the results.
 
-## Create lists of the data files.
-clouds = os.listdir(data_clouds)                                                            # List for the clouds.
-holes  = os.listdir(data_holes)                                                             # List for the clouds with holes.
-
-# Group the files by regions.
-regions_c = group_files_by_region(clouds)                                                   # Create a dictionary for all the regions in Clouds.
-regions_h = group_files_by_region(holes)                                                    # Create a dictionary for all the regions in Holes.
-
 # State the conditions for the problem.
 ## Problem Parameters
 v = 0.1                                                                                     # Diffusion coefficient.
@@ -111,21 +105,46 @@ b = 0.2
 t = 2000                                                                                    # Number of time-steps.
 
 ## Functions for the problem.
-f = lambda x, y, t, coef: (1/(4*t+1))*np.exp(-(x-coef[1]*t-0.5)**2/(coef[0]*(4*t+1)) - (y-coef[2]*t-0.5)**2/(coef[0]*(4*t+1)))
+def f(x, y, t, coef):
+    s  = 4*t + 1                                                                            # Shared factor of the width and the height.
+    ex = (x - coef[1]*t - 0.5)**2                                                           # Squared distance to the center on x.
+    ex += (y - coef[2]*t - 0.5)**2                                                          # Squared distance to the center on y.
+    ex /= -coef[0]*s                                                                        # Exponent of the Gaussian.
+    np.exp(ex, out = ex)                                                                    # The Gaussian, computed in place.
+    ex /= s                                                                                 # Height of the Gaussian.
+    return ex                                                                               # Return the solution.
 
 ## Operator L = [D, E, A, B, C, F]
 L = np.vstack([[-a], [-b], [2*v], [0], [2*v], [0]])                                         # Operator coefficients for Au_{xx} + Bu_{xy} + Cu_{yy} + Du_{x} + Eu_{y} + Fu
 
 # Should I save the results?
 Save = True                                                                                 # Choose wether the results must be saved.
-
-# Solve the problem using a meshless Generalized Finite Difference approach.
-# Solve in clouds.
-print('Processing Clouds of points.')
-for region, files in regions_c.items():                                                     # For each of the regions.
-    process_region(region, files, data_clouds, results_clouds, Save)                        # Process the region.
-
-# Solve in clouds with holes.
-print('Processing Clouds of points with Holes.')
-for region, files in regions_h.items():                                                     # For each of the regions.
-    process_region(region, files, data_holes, results_holes, Save)                          # Process the region.
\ No newline at end of file
+Force = False                                                                               # Choose wether a saved theoretical solution must be computed again, as after editing f.
+
+if __name__ == '__main__':
+    ## Create lists of the data files.
+    clouds = Driver.list_files(data_clouds)                                                 # List for the clouds.
+    holes  = Driver.list_files(data_holes)                                                  # List for the clouds with holes.
+
+    # Group the files by regions.
+    regions_c = Driver.group_files_by_region(clouds)                                        # Create a dictionary for all the regions in Clouds.
+    regions_h = Driver.group_files_by_region(holes)                                         # Create a dictionary for all the regions in Holes.
+
+    # Solve the problem using a meshless Generalized Finite Difference approach.
+    ## The regions are independent, so they are solved in parallel worker processes.
+    ## Workers are spawned, not forked, since forking after the compiled threads start can deadlock.
+    ## The interactive figures need a single worker, so the regions are shown one at a time.
+    workers = None if Save else 1                                                           # All the cores when saving, one worker when showing.
+    with ProcessPoolExecutor(max_workers = workers, mp_context = get_context('spawn'), initializer = Driver.init_worker, initargs = (Save,)) as executor:
+        jobs_c = [executor.submit(process_region, region, files, data_clouds, results_clouds, Save, Force) for region, files in regions_c.items()]
+        jobs_h = [executor.submit(process_region, region, files, data_holes, results_holes, Save, Force) for region, files in regions_h.items()]
+
+        # Solve in clouds.
+        for job in jobs_c:                                                                  # For each of the regions in Clouds.
+            job.result()                                                                    # Wait for the region and raise its errors, if any.
+        print('Clouds of points processed.')
+
+        # Solve in clouds with holes.
+        for job in jobs_h:                                                                  # For each of the regions in Holes.
+            job.result()                                                                    # Wait for the region and raise its errors, if any.
+        print('Clouds of points with Holes processed.')
@@ -27,25 +27,14 @@ Last Modification:
 
 # Library importation
 import os
-import re
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 import numpy as np
 import Scripts.Graph as Graph
 import Scripts.Errors as Errors
+import Scripts.Driver as Driver
 from mGFD import Stationary
 
-## Create a dictionary to get all the regions in da Data folder.
-def group_files_by_region(files):
-    pattern = re.compile(r'^(.*?)(_p\.csv|_tt\.csv)$')                                      # Look for the files ending in "_p.csv" and "_tt.csv"
-    regions = {}                                                                            # Dictionary for the regions.
-    for file in files:                                                                      # For each of the files in clouds.
-        match = pattern.match(file)                                                         # Check for the match of the pattern with the file.
-        if match:                                                                           # If is a match.
-            region, suffix = match.groups()                                                 # Get the name of the region.
-            if region not in regions:                                                       # If the file haven't been added.
-                regions[region] = {}                                                        # Create an empty entry.
-            regions[region][suffix] = file                                                  # Add the file to the regions.
-    return regions                                                                          # Return the regions dictionary.
-
 ## Process the regions and compute the solutions.
 def process_region(region, files, data_path, results_path, save):
     print(f'Working on region: {region}')
@@ -53,28 +42,29 @@ def process_region(region, files, data_path, results_path, save):
         p_file_path  = os.path.join(data_path, files['_p.csv'])                             # Get the file path for the points.
         tt_file_path = os.path.join(data_path, files['_tt.csv'])                            # Get the file path fot the triangles.
 
-        p  = np.genfromtxt(p_file_path,  delimiter=',', skip_header=0)                      # Load the coordinates of the points.
-        tt = np.genfromtxt(tt_file_path, delimiter=',', skip_header=0)                      # Load the triangles correspondence.
+        p  = Driver.load_data(p_file_path)                                                  # Load the coordinates of the points.
+        tt = Driver.load_data(tt_file_path, np.int32)                                       # Load the triangles correspondence.
 
         u_ap, u_ex, vec = Stationary(p, phi, f, operator = L, triangulation = False, tt = None, Adv = False)
                                                                                             # Compute the numerical solution.
 
         er = Errors.Cloud_Stationary(p, vec, u_ap, u_ex)                                    # Compute the error.
-        print(f'\tError: {np.mean(er)}')                                                    # Print the mean of the error.
+        mean_er = float(np.mean(er))                                                        # Mean of the error, computed only once.
+        print(f'\tError: {mean_er}')                                                        # Print the mean of the error.
 
         if save:                                                                            # If we are going to save.
             os.makedirs(os.path.join(results_path, 'Perturbation2', region), exist_ok=True)  # Ensure the directory exists.
             error_path = os.path.join(results_path, 'Perturbation2', region, 'Error.txt')    # Set the name of the file for the error.
             with open(error_path, 'w') as file:                                             # Create the file.
-                file.write(str(np.mean(er)))                                                # Save the error.
+                file.write(str(mean_er))                                                    # Save the error.
 
-            computed_solution_path = os.path.join(results_path, 'Perturbation2', region, 'Computed Solution.csv')
+            computed_solution_path = os.path.join(results_path, 'Perturbation2', region, 'Computed Solution.npy')
                                                                                             # Set the name of the file for the computed solution.
-            np.savetxt(computed_solution_path, u_ap, delimiter = ',', fmt='%.8f')           # Save the computed solution.
+            np.save(computed_solution_path, u_ap)                                           # Save the computed solution.
 
-            theoretical_solution_path = os.path.join(results_path, 'Perturbation2', region, 'Theoretical Solution.csv')
+            theoretical_solution_path = os.path.join(results_path, 'Perturbation2', region, 'Theoretical Solution.npy')
                                                                                             # Set the name of the file for the theoretical solution.
-            np.savetxt(theoretical_solution_path, u_ex, delimiter = ',', fmt = '%.8f')      # Save the theoretical solution.
+            np.save(theoretical_solution_path, u_ex)                                        # Save the theoretical solution.
 
         plot_path = os.path.join(results_path, 'Perturbation2', region, 'Solution')          # Set the name for the resulting graph.
         Graph.Cloud_Stationary(p, tt, u_ap, u_ex, save = save, nom = plot_path)             # Save the resulting graph.
@@ -88,14 +78,6 @@ results_clouds = 'Results/Clouds/'
 data_holes     = 'Data/Holes/'                                                              # Folder with the data of the regions.
 results_holes  = 'Results/Holes/'                                                           # Folder to save the results.
 
-## Create lists of the data files.
-clouds = os.listdir(data_clouds)                                                            # List for the clouds.
-holes  = os.listdir(data_holes)                                                             # List for the clouds with holes.
-
-# Group the files by regions.
-regions_c = group_files_by_region(clouds)                                                   # Create a dictionary for all the regions in Clouds.
-regions_h = group_files_by_region(holes)                                                    # Create a dictionary for all the regions in Holes.
-
 # State the conditions for the problem.
 ## Variables for the problem
 vx = 1
@@ -112,13 +94,30 @@ L = np.vstack([[vx], [vy], [-D], [0], [-D], [0]])
 # Should I save the results?
 Save = True                                                                                 # Choose wether the results must be saved.
 
-# Solve the problem using a meshless Generalized Finite Difference approach.
-# Solve in clouds.
-print('Processing Clouds of points.')
-for region, files in regions_c.items():                                                     # For each of the regions.
-    process_region(region, files, data_clouds, results_clouds, Save)                        # Process the region.
-
-# Solve in clouds with holes.
-print('Processing Clouds of points with Holes.')
-for region, files in regions_h.items():                                                     # For each of the regions.
-    process_region(region, files, data_holes, results_holes, Save)                          # Process the region.
\ No newline at end of file
+if __name__ == '__main__':
+    ## Create lists of the data files.
+    clouds = Driver.list_files(data_clouds)                                                 # List for the clouds.
+    holes  = Driver.list_files(data_holes)                                                  # List for the clouds with holes.
+
+    # Group the files by regions.
+    regions_c = Driver.group_files_by_region(clouds)                                        # Create a dictionary for all the regions in Clouds.
+    regions_h = Driver.group_files_by_region(holes)                                         # Create a dictionary for all the regions in Holes.
+
+    # Solve the problem using a meshless Generalized Finite Difference approach.
+    ## The regions are independent, so they are solved in parallel worker processes.
+    ## Workers are spawned, not forked, since forking after the compiled threads start can deadlock.
+    ## The interactive figures need a single worker, so the regions are shown one at a time.
+    workers = None if Save else 1                                                           # All the cores when saving, one worker when showing.
+    with ProcessPoolExecutor(max_workers = workers, mp_context = get_context('spawn'), initializer = Driver.init_worker, initargs = (Save,)) as executor:
+        jobs_c = [executor.submit(process_region, region, files, data_clouds, results_clouds, Save) for region, files in regions_c.items()]
+        jobs_h = [executor.submit(process_region, region, files, data_holes, results_holes, Save) for region, files in regions_h.items()]
+
+        # Solve in clouds.
+        for job in jobs_c:                                                                  # For each of the regions in Clouds.
+            job.result()                                                                    # Wait for the region and raise its errors, if any.
+        print('Clouds of points processed.')
+
+        # Solve in clouds with holes.
+        for job in jobs_h:                                                                  # For each of the regions in Holes.
+            job.result()                                                                    # Wait for the region and raise its errors, if any.
+        print('Clouds of points with Holes processed.')